@@ -0,0 +1,295 @@
+"""Time the core and the layout on made up trees
+
+    python bench.py --sizes 100 300 1000 --out bench.json
+    python bench.py --compare bench.json
+    python bench.py --memory --sizes 1000
+    python bench.py --memory --unslotted --sizes 1000
+
+results are written as json so runs can be compared against each other
+"""
+from random import Random
+from typing import Callable
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from src.diff import fields, snapshot_people
+from src.family_tree import Person, Tree, read_csv
+from src.layout import layout, order_rows
+from src import family_tree, profiling, synthetic
+from src.gedcom import read_gedcom, write_gedcom
+from src.sqlite_tree import import_csv
+from src.stats import subtree_stats
+
+
+def timed(results: list[dict], size: int, op: str, func: Callable, calls: int=1, repeat: int=1):
+    """run func and record how long it took, the best of repeat runs"""
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        seconds = min(seconds, time.perf_counter() - start)
+    results.append({'size': size, 'op': op, 'seconds': seconds, 'calls': calls})
+    print(f'{size:>8} {op:<14} {seconds:10.4f}s', file=sys.stderr)
+    return value
+
+
+def check_gedcom(tree: Tree, path):
+    """make sure a GEDCOM export reads back as the same people with the same relations"""
+    # read under the REFN ids, which are the tree's own, so their ids have to be free for a moment
+    Person.seen_ids.difference_update(person.id for person in tree)
+    back = read_gedcom(path, use_refn=True)
+    Person.seen_ids.update(person.id for person in tree)
+    old, new = snapshot_people(tree), snapshot_people(back)
+    # GEDCOM has nowhere to keep whether someone's children or spouses are complete
+    kept = [i for i, name in enumerate(fields) if name not in ('child complete', 'spouse complete')]
+    wrong = [
+        person_id
+        for person_id, values in old.people.items()
+        if person_id not in new.people or [values[i] for i in kept] != [new.people[person_id][i] for i in kept]
+    ]
+    assert old.people.keys() == new.people.keys(), 'GEDCOM round trip lost or added people'
+    assert not wrong, f'GEDCOM round trip changed {len(wrong)} people, e.g. {wrong[:3]}'
+    assert old.edges.keys() == new.edges.keys(), 'GEDCOM round trip changed relations'
+
+
+def bench_size(size: int, args, results: list[dict]):
+    rng = Random(args.seed)
+    rows = synthetic.generate_rows(
+        size,
+        generations=args.generations,
+        branching=args.branching,
+        remarriage=args.remarriage,
+        collapse=args.collapse,
+        seed=args.seed,
+        # people ids have to be unique for the whole process
+        prefix=f'{size}-',
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tree.csv')
+        synthetic.write_rows(path, rows)
+        people = timed(results, size, 'csv_load', lambda: read_csv(path))
+        db_path = os.path.join(tmp, 'tree.db')
+        timed(results, size, 'sqlite_import', lambda: import_csv(path, db_path).close())
+
+    # the same as Tree(people) but with connect and fix timed on their own
+    tree = Tree()
+    tree.tree = set(people)
+    timed(results, size, 'connect', tree.connect)
+    timed(results, size, 'fix', tree.fix)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tree.ged')
+        timed(results, size, 'gedcom_export', lambda: write_gedcom(tree, path))
+        # read back under the file's own ids so they don't clash with the tree's
+        timed(results, size, 'gedcom_import', lambda: read_gedcom(path, prefix=f'{size}-ged-'))
+        check_gedcom(tree, path)
+
+    # someone from the last generation so there's plenty above them
+    head = max(tree, key=lambda p: (len(p.parents), p.dob))
+    tree.set_head(head.id)
+
+    # anything that doesn't change the tree can be run a few times to cut the noise
+    repeat = args.repeat
+    everyone = timed(results, size, 'explore', lambda: tree.explore(head), repeat=repeat)
+    near = sorted(tree.explore(head, levels=2), key=lambda p: p.id)
+    sample = rng.sample(near, min(args.samples, len(near)))
+
+    # path is cached so only the first run of it means anything
+    timed(results, size, 'path', lambda: [tree.path(head, p) for p in sample], len(sample))
+    timed(results, size, 'generation', lambda: [tree.generation(head, p) for p in sample], len(sample), repeat)
+
+    names = [rng.choice(sorted(everyone, key=lambda p: p.id)).name.split()[-1] for _ in range(args.samples)]
+    timed(results, size, 'search_names', lambda: [tree.search_names(name) for name in names], len(names), repeat)
+    timed(results, size, 'subtree_stats', lambda: subtree_stats(tree), repeat=repeat)
+
+    result = layout(tree, head, args.levels)
+    rows = list(result.rows.values())
+    timed(results, size, 'order_rows', lambda: order_rows(result.rows), len(rows), repeat)
+    timed(results, size, 'layout', lambda: layout(tree, head, args.levels), repeat=repeat)
+
+
+# the way people and relations were before slots, everything in a __dict__.
+# a class each so their instances share dict keys like two dataclasses would
+class _UnslottedPerson:
+    pass
+
+
+class _UnslottedFamily:
+    pass
+
+
+def _unslotted(people: list[Person]) -> list[_UnslottedPerson]:
+    """copies of people and their relations without slots, holding the same strings"""
+    copies = {}
+    for person in people:
+        copy = copies[person.id] = _UnslottedPerson()
+        for name in Person.__dataclass_fields__:
+            setattr(copy, name, [] if name == 'family' else getattr(person, name))
+    for person in people:
+        for fam in person.family:
+            copy = _UnslottedFamily()
+            copy.relation = fam.relation
+            copy.person_id = fam.person_id
+            copy.person = copies.get(fam.person_id)
+            copy.notes = fam.notes
+            copies[person.id].family.append(copy)
+    return list(copies.values())
+
+
+def _freed(drop: Callable) -> int:
+    """how many bytes drop lets go of"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    drop()
+    gc.collect()
+    return before - tracemalloc.get_traced_memory()[0]
+
+
+def memory_size(size: int, args) -> dict:
+    """how many bytes each person and each relation takes in a connected tree
+
+    it's measured by how much is freed when the relations and then the people
+    are dropped, so Person.seen_ids and the intern table (which never shrink)
+    aren't counted against them. seen_ids is given on its own. with --unslotted
+    it's the model from before slots and interning
+    """
+    rows = synthetic.generate_rows(
+        size,
+        generations=args.generations,
+        branching=args.branching,
+        remarriage=args.remarriage,
+        collapse=args.collapse,
+        seed=args.seed,
+        prefix=f'{size}-mem-',
+    )
+    interned = family_tree.intern
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tree.csv')
+        synthetic.write_rows(path, rows)
+
+        tracemalloc.start()
+        if args.unslotted:
+            # every field keeps the string the csv reader made for it
+            family_tree.intern = lambda value: value
+        try:
+            # after connect and fix so child and sibling relations are there too
+            people = list(Tree(read_csv(path)))
+        finally:
+            family_tree.intern = interned
+
+    seen_bytes = sys.getsizeof(set(person.id for person in people))
+    for person in people:
+        Person.seen_ids.discard(person.id)
+    if args.unslotted:
+        copies = _unslotted(people)
+        for person in people:
+            person.family.clear()
+        people = copies
+        del copies
+
+    edges = sum(len(person.family) for person in people)
+    edge_bytes = _freed(lambda: [person.family.clear() for person in people])
+    person_bytes = _freed(people.clear)
+    tracemalloc.stop()
+
+    out = {
+        'size': size,
+        'model': 'unslotted' if args.unslotted else 'slotted',
+        'people': size,
+        'edges': edges,
+        'bytes_per_person': person_bytes / size,
+        'bytes_per_edge': edge_bytes / max(1, edges),
+        'seen_ids_bytes_per_person': seen_bytes / size,
+    }
+    print(
+        f'{size:>8} {out["model"]:<9} {out["bytes_per_person"]:10.1f} bytes/person {out["bytes_per_edge"]:8.1f} bytes/edge'
+        f' {out["seen_ids_bytes_per_person"]:6.1f} bytes/person in seen_ids',
+        file=sys.stderr,
+    )
+    return out
+
+
+def compare(old: dict, new: dict, threshold: float, floor: float) -> list[str]:
+    """anything that got slower by more than threshold times
+
+    timings under floor seconds are too noisy to count
+    """
+    before = {(r['size'], r['op']): r['seconds'] for r in old['results']}
+    slower = []
+    for r in new['results']:
+        key = (r['size'], r['op'])
+        if key not in before or before[key] <= 0:
+            continue
+        ratio = r['seconds'] / before[key]
+        line = f'{r["size"]:>8} {r["op"]:<14} {before[key]:10.4f}s -> {r["seconds"]:10.4f}s ({ratio:.2f}x)'
+        print(line, file=sys.stderr)
+        if ratio > threshold and r['seconds'] > floor:
+            slower.append(line)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 300, 1000])
+    parser.add_argument('--generations', type=int, default=6)
+    parser.add_argument('--branching', type=float, default=2.5)
+    parser.add_argument('--remarriage', type=float, default=0.1)
+    parser.add_argument('--collapse', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--samples', type=int, default=10, help='how many people to path/search for')
+    parser.add_argument('--levels', type=int, default=2, help='how far out the layout goes')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs for anything repeatable')
+    parser.add_argument('--profile', action='store_true', help='print call counts and timings for each size')
+    parser.add_argument('--memory', action='store_true', help='measure bytes per person and relation instead of timing')
+    parser.add_argument('--unslotted', action='store_true', help='with --memory, measure people and relations without slots or interning')
+    parser.add_argument('--out', help='write results to this json file (default stdout)')
+    parser.add_argument('--compare', help='an earlier results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.5, help='how much slower counts as a regression')
+    parser.add_argument('--floor', type=float, default=0.005, help='ignore regressions in anything quicker than this')
+    args = parser.parse_args(argv)
+
+    results: list[dict] = []
+    memory: list[dict] = []
+    for size in args.sizes:
+        if args.memory:
+            memory.append(memory_size(size, args))
+        elif args.profile:
+            print(f'--- {size} people ---', file=sys.stderr)
+            with profiling.profile():
+                bench_size(size, args, results)
+        else:
+            bench_size(size, args, results)
+
+    output = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'args': {k: v for k, v in vars(args).items() if k not in ('out', 'compare', 'profile')},
+        'results': results,
+    }
+    if memory:
+        output['memory'] = memory
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(json.load(f), output, args.threshold, args.floor)
+        if slower:
+            print('regressions:', *slower, sep='\n', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
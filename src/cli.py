@@ -0,0 +1,210 @@
+"""Answer questions about a tree without opening the viewer
+
+    python -m src.cli data/example1.csv ancestors "Joshua Thomas Andrews"
+    python -m src.cli data/example1.csv < queries.txt
+    python -m src.cli family.db ancestors "Joshua Thomas Andrews"
+
+a .db/.sqlite file (see src.sqlite_tree) is opened lazily instead of loading
+everyone. with no query on the command line, queries are read one per line from stdin.
+every answer is written as one line of json as soon as it's ready
+
+queries:
+    ancestors <id> [levels]
+    descendants <id> [levels]
+    path <id> <id>
+    generation <id> <id>
+    incomplete [levels] (from --head)
+    search <text>
+    kinship <id> <id>
+    inbreeding <id>
+    duplicates [threshold]
+    stats
+    generation_stats <id>
+"""
+from typing import Any, Callable, Iterable, Optional
+import argparse
+import inspect
+import json
+import shlex
+import sys
+from .duplicates import find_duplicates
+from .family_tree import Person, Tree, read_csv
+from .stats import per_generation, subtree_stats
+from .sqlite_tree import SqliteTree
+
+
+sqlite_suffixes = ('.db', '.sqlite', '.sqlite3')
+
+
+class QueryError(Exception):
+    pass
+
+
+def describe(person: Person) -> dict[str, Any]:
+    return {
+        'id': person.id,
+        'name': person.name,
+        'dob': person.dob or None,
+        'dod': person.dod or None,
+    }
+
+
+def _people(people: Iterable[Person]) -> list[dict[str, Any]]:
+    return [describe(person) for person in sorted(people, key=lambda p: str(p.id))]
+
+
+def _get(tree: Tree, person_id: str) -> Person:
+    person = tree.get(person_id)
+    if person is None:
+        raise QueryError(f'no one with id {person_id!r}')
+    return person
+
+
+def _levels(args: list[str]) -> Optional[int]:
+    if not args:
+        return None
+    try:
+        return int(args[0])
+    except ValueError:
+        raise QueryError(f'levels should be a number, not {args[0]!r}')
+
+
+def ancestors(tree: Tree, person_id: str, *levels: str):
+    return _people(tree.ancestors(_get(tree, person_id), _levels(list(levels))))
+
+
+def descendants(tree: Tree, person_id: str, *levels: str):
+    return _people(tree.descendants(_get(tree, person_id), _levels(list(levels))))
+
+
+def path(tree: Tree, a: str, b: str):
+    found = tree.path(_get(tree, a), _get(tree, b))
+    if found is None:
+        return None
+    return [describe(person) for person in found]
+
+
+def generation(tree: Tree, a: str, b: str):
+    return tree.generation(_get(tree, a), _get(tree, b))
+
+
+def incomplete(tree: Tree, *levels: str):
+    # without --head the tree would start from whoever it happened to load first
+    if tree._head is None:
+        raise QueryError('incomplete needs --head to say who to count from')
+    return _people(tree.get_incomplete_nodes(_levels(list(levels))))
+
+
+def search(tree: Tree, *text: str):
+    return _people(tree.search_names(' '.join(text)))
+
+
+def _kinship_module():
+    # numpy is only needed for kinship and inbreeding so it's only imported for them
+    try:
+        from . import kinship
+    except ImportError as e:
+        raise QueryError(f'kinship and inbreeding need numpy, which is not installed ({e})')
+    return kinship
+
+
+def kinship(tree: Tree, a: str, b: str):
+    module = _kinship_module()
+    p1, p2 = _get(tree, a), _get(tree, b)
+    ped = module.for_people(tree, [p1, p2])
+    return module.kinship(ped, [(p1.id, p2.id)])[p1.id, p2.id]
+
+
+def inbreeding(tree: Tree, person_id: str):
+    module = _kinship_module()
+    person = _get(tree, person_id)
+    return module.inbreeding(module.for_people(tree, [person]))[person.id]
+
+
+def duplicates(tree: Tree, *threshold: str):
+    try:
+        cutoff = float(threshold[0]) if threshold else 0.75
+    except ValueError:
+        raise QueryError(f'threshold should be a number, not {threshold[0]!r}')
+    return [{'score': score, 'a': a, 'b': b} for score, a, b in find_duplicates(tree, cutoff, workers=None)]
+
+
+def stats(tree: Tree):
+    return subtree_stats(tree)
+
+
+def generation_stats(tree: Tree, person_id: str):
+    return per_generation(tree, _get(tree, person_id))
+
+
+queries: dict[str, Callable] = {
+    'ancestors': ancestors,
+    'descendants': descendants,
+    'path': path,
+    'generation': generation,
+    'incomplete': incomplete,
+    'search': search,
+    'kinship': kinship,
+    'inbreeding': inbreeding,
+    'duplicates': duplicates,
+    'stats': stats,
+    'generation_stats': generation_stats,
+}
+
+
+def answer(tree: Tree, query: list[str]) -> dict[str, Any]:
+    """run one query, errors are returned rather than raised so a batch keeps going"""
+    name, *args = query
+    out: dict[str, Any] = {'query': name, 'args': args}
+    func = queries.get(name)
+    if func is None:
+        out['error'] = f'unknown query {name!r}'
+        return out
+    try:
+        inspect.signature(func).bind(tree, *args)
+    except TypeError:
+        out['error'] = f'wrong number of arguments for {name}'
+        return out
+    try:
+        out['result'] = func(tree, *args)
+    except (QueryError, ValueError) as e:
+        # ValueError is what the analyses raise for a tree they can't work with, e.g. someone being their own ancestor
+        out['error'] = str(e)
+    return out
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='the family csv (or sqlite file) to load')
+    parser.add_argument('query', nargs='*', help='a single query, otherwise they are read from stdin')
+    parser.add_argument('--head', help='who incomplete is counted from')
+    args = parser.parse_args(argv)
+
+    if args.source.endswith(sqlite_suffixes):
+        tree: Tree = SqliteTree(args.source)
+    else:
+        tree = Tree(read_csv(args.source))
+    if args.head is not None:
+        if tree.get(args.head) is None:
+            parser.error(f'--head: no one with id {args.head!r}')
+        tree.set_head(args.head)
+
+    if args.query:
+        print(json.dumps(answer(tree, args.query)), flush=True)
+        return 0
+
+    for line in sys.stdin:
+        try:
+            query = shlex.split(line)
+        except ValueError as e:
+            # a bad line (e.g. an unclosed quote) shouldn't stop the rest of the batch
+            print(json.dumps({'query': line.strip(), 'error': f'could not parse query: {e}'}), flush=True)
+            continue
+        if not query:
+            continue
+        print(json.dumps(answer(tree, query)), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
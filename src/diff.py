@@ -0,0 +1,219 @@
+"""What changed between two versions of a tree
+
+every person gets a hash of the fields save_str2 writes and the relations
+they're part of, so only people whose hash differs are looked at closely
+
+    old = snapshot_csv('family-2023.csv', cache=True)
+    new = snapshot_csv('family-2024.csv')
+    print(diff(old, new).to_json())
+
+    python -m src.diff family-2023.csv family-2024.csv
+
+relations are compared the same way however they were written: a child's
+parent and the parent's child are one relation, and so is a couple listed on
+both sides. siblings are left out as they only follow from the parents.
+with cache=True the snapshot is kept next to the csv in <csv>.hashes.json and
+reused until the csv changes
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional
+import csv
+import hashlib
+import json
+import os
+import sys
+from .family_tree import Person, Relation
+from .profiling import profiled
+
+
+fields = ('name', 'dob', 'dod', 'sex', 'child complete', 'spouse complete', 'sources', 'notes')
+# (relation, person, other), parent relations are (parent, child, parent)
+EdgeKey = tuple[str, str, str]
+
+
+def normalise_edge(person_id: str, relation: Relation, other_id: str) -> Optional[EdgeKey]:
+    """one relation written the same way from either side, None for ones that aren't kept"""
+    if relation == Relation.adopted_parent:
+        return ('adopted_parent', person_id, other_id)
+    if relation == Relation.adopted_child:
+        return ('adopted_parent', other_id, person_id)
+    if relation.is_parent():
+        return ('parent', person_id, other_id)
+    if relation.is_child():
+        return ('parent', other_id, person_id)
+    if relation.is_spouse():
+        a, b = sorted((person_id, other_id))
+        return (relation.name, a, b)
+    return None
+
+
+@dataclass
+class Snapshot:
+    """Everyone's fields, relations and hashes at one point in time"""
+    people: dict[str, tuple[str, ...]] = field(default_factory=dict)
+    # relation -> its notes
+    edges: dict[EdgeKey, str] = field(default_factory=dict)
+    hashes: dict[str, str] = field(default_factory=dict)
+
+    def add_edge(self, key: Optional[EdgeKey], notes: str):
+        if key is not None and (key not in self.edges or notes):
+            self.edges[key] = notes
+
+    @profiled('Snapshot.rehash')
+    def rehash(self):
+        incident: dict[str, list[str]] = defaultdict(list)
+        for key, notes in self.edges.items():
+            line = '\x1f'.join(key) + '\x1f' + notes
+            incident[key[1]].append(line)
+            incident[key[2]].append(line)
+        self.hashes = {}
+        for person_id, values in self.people.items():
+            h = hashlib.blake2b(digest_size=16)
+            h.update('\x1f'.join(values).encode())
+            for line in sorted(incident.get(person_id, ())):
+                h.update(b'\x1e')
+                h.update(line.encode())
+            self.hashes[person_id] = h.hexdigest()
+
+    def to_json(self) -> dict:
+        return {
+            'people': {person_id: [self.hashes[person_id], *values] for person_id, values in self.people.items()},
+            'edges': [[*key, notes] for key, notes in self.edges.items()],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Snapshot':
+        snap = cls()
+        for person_id, (digest, *values) in data['people'].items():
+            snap.people[person_id] = tuple(values)
+            snap.hashes[person_id] = digest
+        snap.edges = {(relation, a, b): notes for relation, a, b, notes in data['edges']}
+        return snap
+
+
+@profiled()
+def snapshot_rows(rows: Iterable[dict[str, str]]) -> Snapshot:
+    """a snapshot straight from csv rows, without making anyone a Person"""
+    snap = Snapshot()
+    for row in rows:
+        person_id = row['id'] or row['name']
+        snap.people[person_id] = tuple(row[column] or '' for column in fields)
+        if row['family']:
+            for fam in row['family'].split(','):
+                relation, other_id, *notes = fam.split(':')
+                snap.add_edge(normalise_edge(person_id, Relation[relation], other_id), notes[0] if notes else '')
+    snap.rehash()
+    return snap
+
+
+@profiled()
+def snapshot_people(people: Iterable[Person]) -> Snapshot:
+    """a snapshot of people already loaded, e.g. a Tree"""
+    snap = Snapshot()
+    for person in people:
+        person_id = str(person.id)
+        sources = ','.join(person.sources) if isinstance(person.sources, list) else person.sources
+        snap.people[person_id] = tuple(str(value) if value else '' for value in (
+            person.name, person.dob, person.dod, person.sex.name if person.sex else '',
+            person.child_complete, person.spouse_complete, sources, person.notes,
+        ))
+        for fam in person.family:
+            snap.add_edge(normalise_edge(person_id, fam.relation, str(fam.person_id)), fam.notes or '')
+    snap.rehash()
+    return snap
+
+
+def _cache_path(path) -> str:
+    return f'{path}.hashes.json'
+
+
+def snapshot_csv(path, cache: bool=False) -> Snapshot:
+    """a snapshot of a csv, reusing <csv>.hashes.json if it was made from the file as it is now"""
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    if cache and os.path.exists(_cache_path(path)):
+        with open(_cache_path(path)) as f:
+            data = json.load(f)
+        if data.get('stamp') == stamp:
+            return Snapshot.from_json(data)
+
+    with open(path, newline='') as f:
+        snap = snapshot_rows(csv.DictReader(f))
+
+    if cache:
+        with open(_cache_path(path), 'w') as f:
+            json.dump({'stamp': stamp, **snap.to_json()}, f)
+    return snap
+
+
+@dataclass
+class TreeDiff:
+    """Who and what changed going from one snapshot to another"""
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    # person -> the fields that changed ('relations' if only their relations did)
+    modified: dict[str, list[str]] = field(default_factory=dict)
+    relations_added: list[EdgeKey] = field(default_factory=list)
+    relations_removed: list[EdgeKey] = field(default_factory=list)
+    # the relation is still there but its notes changed
+    relations_changed: list[EdgeKey] = field(default_factory=list)
+
+    def __bool__(self):
+        return any((
+            self.added, self.removed, self.modified,
+            self.relations_added, self.relations_removed, self.relations_changed,
+        ))
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            'added': self.added,
+            'removed': self.removed,
+            'modified': self.modified,
+            'relations_added': [list(key) for key in self.relations_added],
+            'relations_removed': [list(key) for key in self.relations_removed],
+            'relations_changed': [list(key) for key in self.relations_changed],
+        }
+
+
+@profiled()
+def diff(old: Snapshot, new: Snapshot) -> TreeDiff:
+    """compare two snapshots, only people whose hash changed have their relations looked at"""
+    out = TreeDiff()
+    out.added = sorted(new.people.keys() - old.people.keys())
+    out.removed = sorted(old.people.keys() - new.people.keys())
+
+    touched = set(out.added) | set(out.removed)
+    for person_id in old.people.keys() & new.people.keys():
+        if old.hashes[person_id] == new.hashes[person_id]:
+            continue
+        touched.add(person_id)
+        changed = [name for name, a, b in zip(fields, old.people[person_id], new.people[person_id]) if a != b]
+        out.modified[person_id] = changed or ['relations']
+    out.modified = dict(sorted(out.modified.items()))
+
+    # every relation that changed has someone whose hash changed at one end of it
+    old_edges = {key for key in old.edges if key[1] in touched or key[2] in touched}
+    new_edges = {key for key in new.edges if key[1] in touched or key[2] in touched}
+    out.relations_added = sorted(new_edges - old_edges)
+    out.relations_removed = sorted(old_edges - new_edges)
+    out.relations_changed = sorted(key for key in old_edges & new_edges if old.edges[key] != new.edges[key])
+    # people whose fields changed might have had their relations change too
+    related = {
+        person_id
+        for key in (*out.relations_added, *out.relations_removed, *out.relations_changed)
+        for person_id in key[1:]
+    }
+    for person_id, changed in out.modified.items():
+        if person_id in related and 'relations' not in changed:
+            changed.append('relations')
+    return out
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python -m src.diff <old csv> <new csv>', file=sys.stderr)
+        sys.exit(1)
+    result = diff(snapshot_csv(sys.argv[1], cache=True), snapshot_csv(sys.argv[2]))
+    json.dump(result.to_json(), sys.stdout, indent=2)
+    print()
@@ -1,86 +1,117 @@
 from collections import defaultdict
-from itertools import zip_longest
-from typing import Any, DefaultDict, Sequence
+from typing import Any, DefaultDict, Iterable, Optional, Sequence
 import pygame
-from .family_tree import Tree, Person, Relation, Sex, Family
-from random import randrange
+from .family_tree import Tree, Person, Relation, Sex, check_name, read_csv
+from .journal import Journal
+from .layout import Layout, LayoutCache, layout, row_spacing
+from .profiling import profiled
+from .watch import Watcher, apply
 from numbers import Number
-import sys
-from functools import cmp_to_key
-import tkinter as tk
-
-
-lookback = 3
+import queue
+import threading
+import traceback
+from functools import lru_cache
+
+
+# how many levels to show straight away, the rest are explored on demand
+lookback = 1
+# how close (in pixels) the view can get to the edge of the tree before
+# the next level gets explored
+edge_margin = 200
+# below label_zoom people are drawn as plain boxes, below box_zoom as dots
+label_zoom = 0.5
+box_zoom = 0.1
+min_zoom = 0.01
+max_zoom = 2
 screen_size = (1500, 900)
+font_size = 24
 pressed = None
 
-class Vector(Sequence):
-    def __init__(self, point) -> None:
-        self.values = list(point)
 
-    def __iter__(self):
-        return iter(self.values)
+@lru_cache(maxsize=None)
+def get_font(size: int) -> pygame.font.Font:
+    """one font per size for the whole process"""
+    return pygame.font.Font(pygame.font.get_default_font(), size)
 
-    def __getitem__(self, key):
-        return self.values[key]
 
-    def __setitem__(self, key, value):
-        self.values[key] = value
+@lru_cache(maxsize=2048)
+@profiled('render_label')
+def render_label(text: str, color: tuple[int, int, int], size: int) -> pygame.Surface:
+    """render a node label, shared between every node with the same look
 
-    def __len__(self):
-        return len(self.values)
+    the returned surface is cached so it must never be drawn on
+    """
+    text_surface = get_font(size).render(text, True, (0, 0, 0))
+    image = pygame.Surface(text_surface.get_size())
+    image.fill((240, 240, 240))
 
-    def __add__(self, other) -> 'Vector':
+    pygame.draw.rect(
+        image,
+        color,
+        (5, 5, *image.get_size()),
+    )
+    image.blit(text_surface, (0, 0))
+    return image
 
-        if isinstance(other, Number):
-            return Vector(
-                [v + other for v in self]
-            )
 
-        if isinstance(other, Sequence):
-            if len(self) != len(other):
-                raise ValueError('Vectors must be same size')
+def clear_caches():
+    """fonts and surfaces die with pygame.quit so forget about them"""
+    get_font.cache_clear()
+    render_label.cache_clear()
 
-            return Vector(
-                [x + y for x, y in zip(self, other)]
-            )
 
-        raise NotImplementedError
+class Vector(tuple):
+    """an immutable 2d point
 
+    built on tuple so it's cheap to make and pygame takes it anywhere it takes
+    a coordinate
+    """
+    __slots__ = ()
 
-    def __sub__(self, other) -> 'Vector':
+    def __new__(cls, point) -> 'Vector':
+        x, y = point
+        return tuple.__new__(cls, (x, y))
 
-        if isinstance(other, Sequence):
-            if len(self) != len(other):
-                raise ValueError('Vectors must be same size')
+    @property
+    def x(self):
+        return self[0]
 
-            return Vector(
-                [x - y for x, y in zip(self, other)]
-            )
+    @property
+    def y(self):
+        return self[1]
 
-        elif isinstance(other, Number):
-            return Vector(
-                [v - other for v in self]
-            )
+    def __add__(self, other) -> 'Vector':
+        if isinstance(other, (int, float)):
+            return Vector((self[0] + other, self[1] + other))
 
-        raise NotImplementedError
+        if len(other) != 2:
+            raise ValueError('Vectors must be same size')
+        return Vector((self[0] + other[0], self[1] + other[1]))
 
-    def __truediv__(self, other: Number) -> 'Vector':
-        return Vector(
-            [v / other for v in self]
-        )
+    def __sub__(self, other) -> 'Vector':
+        if isinstance(other, (int, float)):
+            return Vector((self[0] - other, self[1] - other))
+
+        if len(other) != 2:
+            raise ValueError('Vectors must be same size')
+        return Vector((self[0] - other[0], self[1] - other[1]))
+
+    def __mul__(self, other: Number) -> 'Vector':
+        return Vector((self[0] * other, self[1] * other))
 
-    def __eq__(self, other) -> bool:
-        return type(self) == type(other) and self.values == other.values
+    def __truediv__(self, other: Number) -> 'Vector':
+        return Vector((self[0] / other, self[1] / other))
 
     def __str__(self) -> str:
-        return f'Vector({self.values})'
+        return f'Vector({self[0]}, {self[1]})'
+
+    __repr__ = __str__
 
 
 class Node(pygame.sprite.Sprite):
     def __init__(self, person: Person, pos, offset, complete=True):
         pygame.sprite.Sprite.__init__(self)
-        self.font = pygame.font.Font(pygame.font.get_default_font(), 24)
+        self.font_size = font_size
         self.person = person
         self.parents: list['Node'] = []
         self.spouses: list['Node'] = []
@@ -94,31 +125,52 @@ class Node(pygame.sprite.Sprite):
 
         self.update(offset, None)
 
-    def redraw(self):
-        self.text: pygame.Surface = self.font.render(self.person.name, True, (0, 0, 0))
-        self.image = pygame.Surface(self.text.get_size())
-        self.image.fill((240, 240, 240))
+    @property
+    def label(self) -> str:
+        return self.person.name
 
-        pygame.draw.rect(
-            self.image,
-            self.color,
-            (5, 5, *self.image.get_size()),
-        )
-        self.image.blit(self.text, (0, 0))
+    def redraw(self):
+        # the size at zoom 1 is what the node takes up in the world
+        self.world_size = render_label(self.label, self.color, font_size).get_size()
+        self.image = render_label(self.label, self.color, self.font_size)
 
         # Fetch the rectangle object that has the dimensions of the image
         # Update the position of this object by setting the values of rect.x and rect.y
-        self.rect = self.image.get_rect()
+        if hasattr(self, 'rect'):
+            self.rect = self.image.get_rect(center=self.rect.center)
+        else:
+            self.rect = self.image.get_rect()
 
-    def update(self, offset, mouse_pos):
+    def update(self, offset, mouse_pos, zoom=1):
         if self.clicked:
             self.pos = Vector((
-                mouse_pos[0] - offset[0] + self.click_offset[0],
-                mouse_pos[1] - offset[1] + self.click_offset[1]
+                (mouse_pos[0] - offset[0] + self.click_offset[0]) / zoom,
+                (mouse_pos[1] - offset[1] + self.click_offset[1]) / zoom
             ))
             # self.rect.center = mouse_pos
         # else:
-        self.rect.center = self.pos[0] + offset[0], self.pos[1] + offset[1]
+        self.place((self.pos[0]*zoom + offset[0], self.pos[1]*zoom + offset[1]), zoom)
+
+    def place(self, center, zoom=1):
+        """put the node on screen, picking how much detail to draw for the zoom"""
+        if zoom >= label_zoom:
+            size = max(1, round(font_size * zoom))
+            if size != self.font_size:
+                self.font_size = size
+                self.image = render_label(self.label, self.color, size)
+            self.rect.size = self.image.get_size()
+        else:
+            self.rect.size = (
+                max(2, self.world_size[0] * zoom),
+                max(2, self.world_size[1] * zoom),
+            )
+        self.rect.center = center
+
+    def world_rect(self) -> pygame.Rect:
+        """where this node sits before the view offset and zoom are applied"""
+        rect = pygame.Rect((0, 0), self.world_size)
+        rect.center = self.pos
+        return rect
 
     def click(self, mouse_pos):
         self.click_move = self.pos
@@ -126,8 +178,7 @@ class Node(pygame.sprite.Sprite):
             self.rect.centerx - mouse_pos[0],
             self.rect.centery - mouse_pos[1]
         )
-        if self.rect.collidepoint(mouse_pos):
-            self.clicked = True
+        self.clicked = True
 
     def unclick(self):
         if self.clicked:
@@ -141,9 +192,9 @@ class Node(pygame.sprite.Sprite):
             if spouse.person not in people:
                 continue
             if self.person.sex == Sex.male:
-                self.pos[0] += (spouse.person.sprite.rect.left - self.rect.right)/2-10
+                self.pos += ((spouse.person.sprite.rect.left - self.rect.right)/2-10, 0)
             else:
-                self.pos[0] += (spouse.person.sprite.rect.right - self.rect.left)/2+10
+                self.pos += ((spouse.person.sprite.rect.right - self.rect.left)/2+10, 0)
 
     def move_children(self, people: Sequence[Person]):
         positions = []
@@ -151,108 +202,459 @@ class Node(pygame.sprite.Sprite):
             if child.person in people:
                 positions.append(child.person.sprite.rect.centerx)
         if positions:
-            self.pos[0] += sum(positions)/len(positions) - self.rect.centerx
+            self.pos += (sum(positions)/len(positions) - self.rect.centerx, 0)
 
     def set_pos(self, pos):
         self.pos = Vector(pos)
 
 
+class SummaryNode(Node):
+    """Stands in for a folded up set of ancestors or descendants"""
+    def __init__(self, owner: Node, members: set[Any], ancestors: bool):
+        self.owner = owner
+        self.members = members
+        self.ancestors = ancestors
+        step = -row_spacing if ancestors else row_spacing
+        Node.__init__(self, owner.person, owner.pos + (0, step), (0, 0))
+        self.color = (220, 220, 250)
+        self.redraw()
 
+    @property
+    def label(self) -> str:
+        kind = 'ancestors' if self.ancestors else 'descendants'
+        return f'{len(self.members)} {kind}'
+
+
+class SpatialIndex:
+    """a uniform grid over world space
+
+    hit tests only look at the nodes in the cell under the point instead of
+    every node in the tree
+    """
+    def __init__(self, nodes: Iterable[Node]=(), cell_size: int=256):
+        self.cell_size = cell_size
+        self.cells: DefaultDict[tuple[int, int], list[Node]] = defaultdict(list)
+        self.node_cells: dict[Node, list[tuple[int, int]]] = {}
+        for node in nodes:
+            self.insert(node)
+
+    def _span(self, rect) -> tuple[range, range]:
+        left, top, width, height = rect
+        size = self.cell_size
+        return (
+            range(int(left // size), int((left + width) // size) + 1),
+            range(int(top // size), int((top + height) // size) + 1),
+        )
 
-
-def sort_people(tree: Tree, head: Person, p1: Person, p2: Person):
-    path1 = tree.path(head, p1)
-    path2 = tree.path(head, p2)
-    # print(p1.id, p2.id)
-    generation = tree.generation(head, p1)
-    assert generation == tree.generation(head, p2)
-    # print(f'{generation=}')
-    # print(f'{p1.name=}')
-    # print(f'{p2.name=}')
-    # print([p.name for p in path1])
-    # print([p.name for p in path2])
-
-    if generation > 0:
-        ### THIS WORKS DON'T MESS WITH IT
-        last_s1 = last_s2 = None
-        for s1, s2 in zip_longest(path1, path2):
-            s1: Person
-            s2: Person
-            if not s1 or not s2:
-                break
-            if s1 != s2:
-                # father should be left of mother
-                if last_s1.get_relation(s1) == Relation.father:
-                    return -1
-                else:
-                    return 1
-            last_s1 = s1
-            # last_s2 = s2
-
-        if len(path1) > len(path2):
-            if p2.sex == Sex.male:
-                return -1
-            return 1
-        elif len(path1) < len(path2):
-            if p1.sex == Sex.male:
-                return 1
-            return -1
-        else:
-            raise Exception("shouldn't be here looking for ancestor")
-    elif generation < 0:
-        # if (p1.id == '12' and p2.id == '34') or (p2.id == '12' and p1.id == '34'):
-        #     print(len(path1) > len(path2))
-        #     print(len(path1) < len(path2))
-        for s1, s2 in zip_longest(path1, path2):
-            s1: Person
-            s2: Person
-            if not s1 or not s2:
-                break
-            if s1 != s2:
-                if s1.dob is not None and s2.dob is not None:
-                    if s1.dob < s2.dob:
-                        return -1
-                    elif s1.dob > s2.dob:
-                        return 1
-                else:
-                    if s1.name < s2.name:
-                        return -1
-                    elif s1.name > s2.name:
-                        return 1
-                    else:
-                        print('bbbbbbbbbbbbbbbbbbb')
-                        print(s1.name, s2.name)
-        last_relation = path1[-1].get_relation(path2[-1])
-        if last_relation and last_relation.is_spouse():
-            if path1[-1].sex == Sex.male:
-                return -1
+    def _cells(self, rect) -> list[tuple[int, int]]:
+        xs, ys = self._span(rect)
+        return [(x, y) for x in xs for y in ys]
+
+    def insert(self, node: Node):
+        cells = self._cells(node.world_rect())
+        self.node_cells[node] = cells
+        for cell in cells:
+            self.cells[cell].append(node)
+
+    def remove(self, node: Node):
+        for cell in self.node_cells.pop(node, ()):
+            self.cells[cell].remove(node)
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def move(self, node: Node):
+        """call after a node changes position or size, nodes that aren't in the index (folded away) stay out"""
+        if node not in self.node_cells:
+            return
+        self.remove(node)
+        self.insert(node)
+
+    @profiled()
+    def at(self, point) -> Optional[Node]:
+        """the node at a point in world space, if there is one"""
+        size = self.cell_size
+        cell = (int(point[0] // size), int(point[1] // size))
+        for node in reversed(self.cells.get(cell, ())):
+            if node.world_rect().collidepoint(point):
+                return node
+        return None
+
+    @profiled()
+    def query(self, rect) -> set[Node]:
+        """every node that might overlap a rect in world space"""
+        found: set[Node] = set()
+        xs, ys = self._span(rect)
+        if len(xs) * len(ys) > len(self.cells):
+            # zoomed out the view covers far more cells than have anything in them
+            for (x, y), nodes in self.cells.items():
+                if x in xs and y in ys:
+                    found.update(nodes)
+            return found
+        for cell in self._cells(rect):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+
+class Scene:
+    """The nodes that are on screen and the index over them"""
+    def __init__(self):
+        self.nodes: dict[Any, Node] = {}
+        self.group = pygame.sprite.Group()
+        self.index = SpatialIndex()
+        self.generations: tuple[int, ...] = ()
+        self.bounds = pygame.Rect(0, 0, 0, 0)
+        self.levels: Optional[int] = 0
+        # who the nodes are laid out around, a layout for them again leaves everyone already here alone
+        self.head_id: Any = None
+        # set once exploring another level stops finding new people
+        self.exhausted = False
+        # (person id, ancestors) -> the summary node that person's fold is drawn as
+        self.folds: dict[tuple[Any, bool], SummaryNode] = {}
+        # person id -> the fold hiding them
+        self.hidden: dict[Any, tuple[Any, bool]] = {}
+
+    @profiled()
+    def apply(self, result: Layout):
+        """move to a new layout, only making sprites for people we haven't drawn yet
+
+        if it's around the same head, people already here stay where they are
+        (wherever they've been dragged to) and only new people are placed
+        """
+        keep = result.head.id == self.head_id
+        self.head_id = result.head.id
+        if result.levels is not None and self.levels is not None and result.levels > self.levels:
+            self.exhausted = len(result.people) == len(self.nodes)
+        self.levels = result.levels
+
+        folds = list(self.folds)
+        for key in folds:
+            self.unfold(key)
+
+        ids = {person.id for person in result.people}
+        for gone in self.nodes.keys() - ids:
+            node = self.nodes.pop(gone)
+            self.group.remove(node)
+            self.index.remove(node)
+
+        for person in result.people:
+            node = self.nodes.get(person.id)
+            if node is None:
+                node = Node(person, result.positions[person.id], (0, 0))
+                self.nodes[person.id] = node
+                self.group.add(node)
+                self.index.insert(node)
+            elif not keep:
+                node.set_pos(result.positions[person.id])
+                self.index.move(node)
+
+        # fold things back up, including anyone new that falls inside a fold
+        for person_id, ancestors in folds:
+            if person_id in self.nodes and person_id not in self.hidden:
+                self.fold(self.nodes[person_id], ancestors)
+
+        self.connect()
+        self.generations = tuple(sorted(set(result.generation.values())))
+        self.bounds = pygame.Rect(0, 0, 0, 0)
+        if self.nodes:
+            rects = [node.world_rect() for node in self.nodes.values()]
+            self.bounds = rects[0].unionall(rects[1:])
+
+    def connect(self):
+        for node in self.nodes.values():
+            node.parents = [
+                self.nodes[parent.person_id]
+                for parent in node.person.parents
+                if parent.person_id in self.nodes and parent.person_id not in self.hidden
+            ]
+            node.spouses = [
+                self.nodes[spouse.person_id]
+                for spouse in node.person.spouses
+                if spouse.person_id in self.nodes and spouse.person_id not in self.hidden
+            ]
+        for summary in self.folds.values():
+            if summary.ancestors:
+                summary.owner.parents.append(summary)
             else:
-                return 1
+                summary.parents = [summary.owner]
+
+    def placed(self) -> dict[Any, tuple[float, float]]:
+        """where everyone is, for laying out more people around them"""
+        return {person_id: (node.pos.x, node.pos.y) for person_id, node in self.nodes.items()}
+
+    def _subtree(self, person: Person, ancestors: bool) -> set[Any]:
+        """ids of the shown ancestors or descendants of someone"""
+        found: set[Any] = set()
+        todo = [person]
+        while todo:
+            current = todo.pop()
+            relatives = current.parents if ancestors else current.children
+            for fam in relatives:
+                if fam.person_id in found or fam.person_id not in self.nodes:
+                    continue
+                if fam.person_id in self.hidden:
+                    continue
+                found.add(fam.person_id)
+                todo.append(fam.person)
+        return found
+
+    def _hide(self, person_id: Any, key: tuple[Any, bool]):
+        self.hidden[person_id] = key
+        for node in [self.nodes[person_id]] + [
+            summary for summary in self.folds.values() if summary.owner.person.id == person_id
+        ]:
+            self.group.remove(node)
+            self.index.remove(node)
+
+    def _show(self, person_id: Any):
+        del self.hidden[person_id]
+        for node in [self.nodes[person_id]] + [
+            summary for summary in self.folds.values() if summary.owner.person.id == person_id
+        ]:
+            self.group.add(node)
+            self.index.insert(node)
+
+    def fold(self, node: Node, ancestors=False):
+        """collapse everyone above or below a node into a single summary node"""
+        key = (node.person.id, ancestors)
+        if key in self.folds:
+            return
+        members = self._subtree(node.person, ancestors)
+        if not members:
+            return
+        summary = SummaryNode(node, members, ancestors)
+        self.folds[key] = summary
+        for person_id in members:
+            self._hide(person_id, key)
+        self.group.add(summary)
+        self.index.insert(summary)
+        self.connect()
+
+    def unfold(self, key: tuple[Any, bool]):
+        summary = self.folds.pop(key)
+        self.group.remove(summary)
+        self.index.remove(summary)
+        for person_id in [p for p, k in self.hidden.items() if k == key]:
+            self._show(person_id)
+        self.connect()
+
+    def toggle_fold(self, node: Node, ancestors=False):
+        if isinstance(node, SummaryNode):
+            self.unfold((node.owner.person.id, node.ancestors))
+        elif (node.person.id, ancestors) in self.folds:
+            self.unfold((node.person.id, ancestors))
         else:
-            # should be sibling
-            if path1[-1].dob is not None and path2[-1].dob is not None:
-                if path1[-1].dob < path2[-1].dob:
-                    return -1
-                elif path2[-1].dob > path1[-1].dob:
-                    return 1
-            else:
-                if path1[-1].name < path2[-1].name:
-                    return -1
-                elif path1[-1].name > path2[-1].name:
-                    return 1
+            self.fold(node, ancestors)
+
+    def near_edge(self, view: pygame.Rect) -> bool:
+        """whether a view (in world space) is getting close to the edge of the tree"""
+        inner = self.bounds.inflate(-2*edge_margin, -2*edge_margin)
+        return not inner.contains(view)
+
+
+class Expander:
+    """Lays out deeper levels of the tree on a worker thread
+
+    the render loop polls for finished layouts so it never has to wait on
+    exploring or sorting. anything that changes the tree has to hold lock, the
+    worker holds it while it reads the tree
+    """
+    def __init__(self, tree: Tree, head: Person):
+        self.tree = tree
+        self.head = head
+        self.results: queue.Queue[Optional[Layout]] = queue.Queue()
+        self.busy = False
+        self.lock = threading.RLock()
+
+    def focus(self, head: Person):
+        """lay out around someone else from now on
+
+        anything still running for the old head is left to finish, poll hands
+        back every layout and it's up to the caller to check who it's for
+        """
+        self.head = head
+        self.busy = False
+
+    def request(self, levels: Optional[int], fixed: Optional[dict[Any, tuple[float, float]]]=None):
+        """lay out levels around the head, fixed is where people already on screen are (see layout)"""
+        if self.busy:
+            return
+        self.busy = True
+        threading.Thread(target=self._run, args=(self.head, levels, fixed), daemon=True).start()
+
+    def _run(self, head: Person, levels: Optional[int], fixed: Optional[dict[Any, tuple[float, float]]]):
+        try:
+            with self.lock:
+                result = layout(self.tree, head, levels, fixed)
+        except Exception:
+            traceback.print_exc()
+            result = None
+        self.results.put(result)
+
+    def poll(self) -> Optional[Layout]:
+        try:
+            result = self.results.get_nowait()
+        except queue.Empty:
+            return None
+        self.busy = False
+        return result
+
+
+class Inspector:
+    """A panel down the side of the window for looking at and editing someone
+
+    it lives inside the pygame loop so the tree keeps drawing while it's open.
+    click a field (or press tab) to edit it, enter saves and escape closes
+    """
+    fields = ('name', 'dob', 'dod')
+    width = 420
+    text_size = 18
+    line_height = 26
+
+    def __init__(self, person: Person, journal: Optional[Journal]=None, lock: Optional[threading.RLock]=None):
+        self.person = person
+        self.journal = journal
+        # held while saving, see Expander
+        self.lock = lock or threading.RLock()
+        self.values = {field: getattr(person, field) or '' for field in self.fields}
+        self.focus: Optional[str] = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.field_rects: dict[str, pygame.Rect] = {}
+        self.save_rect = pygame.Rect(0, 0, 0, 0)
+        self.close_rect = pygame.Rect(0, 0, 0, 0)
+        self.saved = False
+        self.closed = False
+        # why the last save didn't happen, shown above the buttons
+        self.error: Optional[str] = None
+        pygame.key.start_text_input()
+
+    def close(self):
+        self.closed = True
+        pygame.key.stop_text_input()
+
+    def save(self):
+        """write the fields back to the person (through the journal if there is one)
+
+        a name the csv can't hold isn't saved, the panel stays open showing why
+        """
+        try:
+            check_name(self.values['name'])
+        except ValueError as error:
+            self.error = str(error)
+            return
+        with self.lock:
+            for field in self.fields:
+                value = self.values[field]
+                if field != 'name':
+                    value = value or None
+                if self.journal is not None:
+                    self.journal.set(self.person, field, value)
                 else:
-                    print('eeeeeeeeeeeeeeeeeee')
-                    print(path1[-1].name, path2[-1].name)
-        return randrange(-1, 2)
-    else:
-        # print('fffffffffffffffff')
-        # return int(input(f'{p1.name} vs {p2.name}'))
-        return randrange(-1, 2)
+                    setattr(self.person, field, value)
+        self.saved = True
+        self.close()
+
+    def handle(self, e) -> bool:
+        """deal with an event, returns whether the tree should ignore it"""
+        if e.type == pygame.MOUSEBUTTONDOWN and e.button == pygame.BUTTON_LEFT:
+            if not self.rect.collidepoint(e.pos):
+                return False
+            self.focus = None
+            for field, rect in self.field_rects.items():
+                if rect.collidepoint(e.pos):
+                    self.focus = field
+            if self.save_rect.collidepoint(e.pos):
+                self.save()
+            elif self.close_rect.collidepoint(e.pos):
+                self.close()
+            return True
+
+        if e.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+            return self.rect.collidepoint(e.pos)
+
+        if e.type == pygame.TEXTINPUT:
+            if self.focus is not None:
+                self.values[self.focus] += e.text
+                self.error = None
+            return True
+
+        if e.type == pygame.KEYDOWN:
+            if e.key == pygame.K_ESCAPE:
+                self.close()
+            elif e.key == pygame.K_RETURN:
+                self.save()
+            elif e.key == pygame.K_TAB:
+                i = self.fields.index(self.focus) + 1 if self.focus else 0
+                self.focus = self.fields[i % len(self.fields)]
+            elif self.focus is None:
+                # not typing into anything so let the tree have it
+                return False
+            elif e.key == pygame.K_BACKSPACE:
+                self.values[self.focus] = self.values[self.focus][:-1]
+                self.error = None
+            return True
+
+        return False
+
+    def draw(self, screen: pygame.Surface):
+        font = get_font(self.text_size)
+        self.rect = pygame.Rect(screen.get_width() - self.width, 0, self.width, screen.get_height())
+        screen.fill((250, 250, 250), self.rect)
+        pygame.draw.line(screen, (0, 0, 0), self.rect.topleft, self.rect.bottomleft)
+
+        x = self.rect.left + 10
+        y = 10
+        for field in self.fields:
+            screen.blit(font.render(field, True, (100, 100, 100)), (x, y))
+            y += self.line_height
+            rect = pygame.Rect(x, y, self.width - 20, self.line_height)
+            self.field_rects[field] = rect
+            screen.fill((255, 255, 255), rect)
+            pygame.draw.rect(screen, (0, 0, 0) if field == self.focus else (180, 180, 180), rect, 1)
+            text = self.values[field] + ('|' if field == self.focus else '')
+            screen.blit(font.render(text, True, (0, 0, 0)), (x + 4, y + 4))
+            y += self.line_height + 10
+
+        screen.blit(font.render('relations', True, (100, 100, 100)), (x, y))
+        y += self.line_height
+        for fam in self.person.family:
+            if fam.relation in (Relation.sibling, Relation.step_sibling):
+                continue
+            name = fam.person.name if fam.person is not None else fam.person_id
+            screen.blit(font.render(f'{fam.relation.name}: {name}', True, (0, 0, 0)), (x, y))
+            y += self.line_height
+            if y > self.rect.bottom - 3*self.line_height:
+                break
+
+        y = self.rect.bottom - 2*self.line_height
+        if self.error:
+            screen.blit(font.render(self.error, True, (200, 0, 0)), (x, y - self.line_height))
+        self.save_rect = pygame.Rect(x, y, 100, self.line_height)
+        self.close_rect = pygame.Rect(self.rect.right - 110, y, 100, self.line_height)
+        for rect, text in ((self.save_rect, 'save'), (self.close_rect, 'close')):
+            screen.fill((220, 220, 220), rect)
+            screen.blit(font.render(text, True, (0, 0, 0)), (rect.x + 4, rect.y + 4))
+
+
+@profiled()
+def place_nodes(nodes: Iterable[Node], offset, zoom=1):
+    """move every sprite to its place on screen for a view offset and zoom
+
+    panning only changes the offset, so this is the only per-node work it needs
+    """
+    ox, oy = offset
+    for node in nodes:
+        x, y = node.pos
+        node.place((x*zoom + ox, y*zoom + oy), zoom)
+
 
-    # raise NotImplementedError
+def view_rect(screen: pygame.Surface, offset, zoom=1) -> pygame.Rect:
+    """the part of the world that's on screen"""
+    width, height = screen.get_size()
+    return pygame.Rect(-offset[0]/zoom, -offset[1]/zoom, width/zoom, height/zoom)
 
 
-def _draw(screen, offset: tuple[int, int], nodes: dict[Any, Node], nodeGroup, generations):
+@profiled('draw')
+def _draw(screen, offset: tuple[int, int], visible: Iterable[Node], generations, hovered: Optional[Node]=None, zoom=1, inspector: Optional[Inspector]=None):
     screen.fill((255, 255, 255))
     # screen.blit(people[0].image, (0, 0))
 
@@ -260,13 +662,10 @@ def _draw(screen, offset: tuple[int, int], nodes: dict[Any, Node], nodeGroup, ge
         pygame.draw.rect(
             screen,
             (240, 240, 240),
-            (0, i*300+offset[1]+40, screen.get_width(), 40)
+            (0, (-i*row_spacing-20)*zoom+offset[1], screen.get_width(), max(1, 40*zoom))
         )
 
-    people = [node.person for node in nodeGroup]
-
-    for node in nodes.values():
-        person = node.person
+    for node in visible:
         # draw a line to parents
         #   if there's 1 parent in the tree draw to them
         #   if there's 2 draw a line between them
@@ -277,112 +676,234 @@ def _draw(screen, offset: tuple[int, int], nodes: dict[Any, Node], nodeGroup, ge
             parent0 = node.parents[0]
             parent1 = node.parents[1]
             new_pos = (
-                Vector(parent0.rect.center) +
-                Vector(parent1.rect.center)
-            )/2
+                (parent0.rect.centerx + parent1.rect.centerx) / 2,
+                (parent0.rect.centery + parent1.rect.centery) / 2,
+            )
             pygame.draw.line(screen, (0, 0, 0), node.rect.center, new_pos)
 
         # draw a red line between spouses
-        for spouse in node.spouses:
-            pygame.draw.line(screen, (255, 0, 0), node.rect.center, spouse.rect.center, 3)
+        if zoom >= box_zoom:
+            for spouse in node.spouses:
+                pygame.draw.line(screen, (255, 0, 0), node.rect.center, spouse.rect.center, max(1, round(3*zoom)))
 
-    nodeGroup.draw(screen)
+    if zoom >= label_zoom:
+        screen.blits([(node.image, node.rect) for node in visible], False)
+    else:
+        # too small to read so don't bother with text
+        for node in visible:
+            screen.fill(node.color, node.rect)
+    if hovered is not None:
+        pygame.draw.rect(screen, (0, 0, 0), hovered.rect, 1)
+    if inspector is not None:
+        inspector.draw(screen)
 
     pygame.display.update()
 
 
-def drawTree(tree: Tree, head: Person=None):
+def drawTree(tree: Tree, head: Person=None, journal: Optional[Journal]=None, watch: Iterable=()):
+    """show the tree, watch is csv files to keep an eye on and apply changes from while it's open"""
     global pressed
     pygame.init()
 
     # print('start...')
 
-    # print(sort_people(tree, tree.head, tree.get('1'), tree.get('18')))
-    # print(sort_people(tree, tree.head, tree.get('3'), tree.get('14')))
-
     if head is None:
         head = tree.head
 
     offset: Vector = Vector(screen_size) / 2
     drag_screen = None
 
+    # a small ring around the head so the window opens straight away
+    scene = Scene()
+    layouts = LayoutCache()
+    first = layout(tree, head, lookback)
+    layouts.put(first)
+    scene.apply(first)
+    expander = Expander(tree, head)
+    watcher = Watcher(watch) if watch else None
+    # set when the tree changed under the layout and it needs doing again once the expander is free
+    relayout = False
+    # set while waiting on the first layout for a new head, where their node was on screen
+    anchor: Optional[Vector] = None
 
-    generation_rows: DefaultDict[int, list[Node]] = defaultdict(list)
-    nodes: dict[Any, Node] = {}
-
-    # create nodes
-    people = tree.explore(levels=lookback)
-    # print(people)
-    for person in people:
-        nodes[person.id] = Node(person, (0, 0), offset)
-        gen = tree.generation(head, person)
-        generation_rows[gen].append(nodes[person.id])
-
-    generations = tuple(generation_rows.keys())
-
-    # filter by generation
-    for generation in generation_rows:
-        generation_rows[generation].sort(key=cmp_to_key(lambda x, y: sort_people(tree, head, x.person, y.person)))
-        count = len(generation_rows[generation])
-        for i, node in enumerate(generation_rows[generation]):
-            node.set_pos((
-                (i - count/2) * 500,
-                (max(generation_rows)-generation) * 300
-            ))
-
-    # connect nodes
-    for node in nodes.values():
-        for parent in node.person.parents:
-            if parent.person_id not in nodes:
-                continue
-            node.parents.append(nodes[parent.person_id])
-        for spouse in node.person.spouses:
-            if spouse.person_id not in nodes:
-                continue
-            node.spouses.append(nodes[spouse.person_id])
-
-    print('total =', len(nodes))
-    print('---done---')
     screen: pygame.Surface = pygame.display.set_mode(screen_size, pygame.RESIZABLE)
-    nodeGroup = pygame.sprite.Group(nodes.values())
+    placed_view = None
+    visible: list[Node] = []
+    zoom = 1
+    dragging: Optional[Node] = None
+    inspector: Optional[Inspector] = None
+    focus: Optional[Person] = None
+
+    def show(result: Layout):
+        """put a layout on screen, keeping the head where they were if we just changed head"""
+        nonlocal anchor, offset, placed_view, dragging
+        scene.apply(result)
+        placed_view = None
+        if dragging is not None and dragging not in scene.group:
+            dragging = None
+        if anchor is not None and head.id in scene.nodes:
+            offset = anchor - scene.nodes[head.id].pos * zoom
+        anchor = None
+
+    def placed() -> Optional[dict[Any, tuple[float, float]]]:
+        """where the people on screen are, if they're laid out around the head (so a new layout keeps them there)"""
+        return scene.placed() if scene.head_id == head.id else None
+
+    def current_offset() -> Vector:
+        if drag_screen is not None:
+            return offset + (mouse - drag_screen)
+        return offset
 
     while True:
         mouse = Vector(pygame.mouse.get_pos())
-        if drag_screen is not None:
-            diff = mouse - drag_screen
-            view_offset = offset + diff
-        else:
-            view_offset = offset
-
-        nodeGroup.update(view_offset, mouse)
+        view_offset = current_offset()
+
+        if focus is not None and focus.id != head.id:
+            # make someone else the head, straight from the cache if they've been it recently
+            node = scene.nodes.get(focus.id)
+            anchor = view_offset + node.pos * zoom if node is not None else None
+            head = focus
+            expander.focus(head)
+            scene.exhausted = False
+            cached = layouts.get(head.id)
+            if cached is not None:
+                show(cached)
+            else:
+                expander.request(lookback)
+        focus = None
+
+        result = expander.poll()
+        if result is not None:
+            layouts.put(result)
+            if result.head.id == head.id:
+                show(result)
+        change = watcher.poll() if watcher is not None else None
+        if change is not None:
+            with expander.lock:
+                touched = apply(tree, change)
+            layouts.clear()
+            if change.structural:
+                relayout = True
+            else:
+                # only what's written on people changed so just redraw them where they are
+                for person_id in touched:
+                    node = scene.nodes.get(person_id)
+                    if node is not None:
+                        node.redraw()
+                        scene.index.move(node)
+                placed_view = None
+        if relayout and not expander.busy:
+            expander.request(scene.levels, placed())
+            relayout = False
+
+        view_offset = current_offset()
+        view = view_rect(screen, view_offset, zoom)
+        if not scene.exhausted and scene.near_edge(view):
+            expander.request(scene.levels + 1, placed())
+
+        # only the people on screen (and who they have lines to) get placed
+        if (view_offset, zoom) != placed_view:
+            visible = list(scene.index.query(view))
+            linked = {other for node in visible for other in node.parents + node.spouses}
+            place_nodes(linked.union(visible), view_offset, zoom)
+            placed_view = (view_offset, zoom)
+        if dragging is not None:
+            dragging.update(view_offset, mouse, zoom)
+        hovered = scene.index.at((mouse - view_offset) / zoom)
         if pressed:
-            press(tree, pressed)
-            if not pygame.get_init():
-                return
-            for node in nodes.values():
-                node.redraw()
+            if inspector is not None:
+                inspector.close()
+            inspector = Inspector(pressed, journal, expander.lock)
         pressed = None
-
-        _draw(screen, view_offset, nodes, nodeGroup, generations)
+        if inspector is not None and inspector.closed:
+            if inspector.saved:
+                # only the person we were looking at can have changed
+                node = scene.nodes.get(inspector.person.id)
+                if node is not None:
+                    node.redraw()
+                    scene.index.move(node)
+                layouts.clear()
+            inspector = None
+
+        _draw(screen, view_offset, visible, scene.generations, hovered, zoom, inspector)
 
         for e in pygame.event.get():
+            if inspector is not None and e.type != pygame.QUIT and inspector.handle(e):
+                continue
             if e.type == pygame.MOUSEBUTTONDOWN:
                 if e.button == pygame.BUTTON_RIGHT:
                     drag_screen = mouse
                 elif e.button == pygame.BUTTON_LEFT:
-                    for n in nodeGroup:
-                        n.click(mouse)
+                    dragging = hovered
+                    if dragging is not None:
+                        dragging.click(mouse)
 
             elif e.type == pygame.MOUSEBUTTONUP:
                 if e.button == pygame.BUTTON_RIGHT and drag_screen is not None:
                     drag_screen = None
                     offset = view_offset
-                elif e.button == pygame.BUTTON_LEFT:
-                    for n in nodeGroup:
-                        n.unclick()
+                elif e.button == pygame.BUTTON_LEFT and dragging is not None:
+                    if isinstance(dragging, SummaryNode) and dragging.click_move == dragging.pos:
+                        # clicking a summary opens it back up
+                        dragging.clicked = False
+                        scene.toggle_fold(dragging)
+                        placed_view = None
+                    else:
+                        dragging.unclick()
+                        scene.index.move(dragging)
+                        if pressed and pygame.key.get_mods() & pygame.KMOD_CTRL:
+                            # ctrl+click makes someone the head instead of opening them
+                            focus = pressed
+                            pressed = None
+                    dragging = None
+
+            elif e.type == pygame.MOUSEWHEEL:
+                new_zoom = min(max_zoom, max(min_zoom, zoom * 1.25 ** e.y))
+                # keep whatever is under the mouse where it is
+                world = (mouse - view_offset) / zoom
+                offset = mouse - world * new_zoom
+                if drag_screen is not None:
+                    drag_screen = mouse
+                zoom = new_zoom
+
+            elif e.type == pygame.VIDEORESIZE:
+                placed_view = None
+
+            elif e.type == pygame.KEYDOWN and e.key == pygame.K_g and hovered is not None:
+                # g folds up descendants, shift+g ancestors
+                scene.toggle_fold(hovered, bool(e.mod & pygame.KMOD_SHIFT))
+                placed_view = None
+
+            elif e.type == pygame.KEYDOWN and e.key == pygame.K_e and not scene.exhausted:
+                expander.request(scene.levels + 1, placed())
+
+            elif e.type == pygame.KEYDOWN and e.key == pygame.K_f and hovered is not None and not isinstance(hovered, SummaryNode):
+                # f (or ctrl+click) makes whoever is under the mouse the head
+                focus = hovered.person
+
+            elif e.type == pygame.KEYDOWN and e.key in (pygame.K_z, pygame.K_y) and e.mod & pygame.KMOD_CTRL and journal is not None:
+                # ctrl+z undoes the last edit, ctrl+y (or ctrl+shift+z) redoes it
+                with expander.lock:
+                    if e.key == pygame.K_y or e.mod & pygame.KMOD_SHIFT:
+                        entry = journal.redo()
+                    else:
+                        entry = journal.undo()
+                if entry is not None:
+                    layouts.clear()
+                if entry is not None and entry['op'] == 'set':
+                    node = scene.nodes.get(entry['id'])
+                    if node is not None:
+                        node.redraw()
+                        scene.index.move(node)
+                elif entry is not None:
+                    # the expander might be busy, so ask for the layout once it's free
+                    relayout = True
 
             elif e.type == pygame.QUIT:
+                if watcher is not None:
+                    watcher.stop()
                 pygame.quit()
+                clear_caches()
                 return
             # elif e.type == pygame.KEYDOWN and e.key == pygame.K_h:
             #     for person in tuple(people):
@@ -393,25 +914,6 @@ def drawTree(tree: Tree, head: Person=None):
             #                 generation_rows[generation].sort(key=lambda x:x.sprite.pos[0])
             #                 if person in generation_rows[generation]:
             #                     generation_rows[generation].remove(person)
-            # elif e.type == pygame.KEYDOWN and e.key == pygame.K_g:
-            #     for person in tuple(people):
-            #         if person.sprite.rect.collidepoint(mouse):
-            #             any_children = False
-            #             for sib in person.siblings:
-            #                 if sib.person.name.endswith(' children'):
-            #                     sib.person.name = str(int(sib.person.name.split()[0]) + 1) + ' children'
-            #                     any_children = True
-            #                     sib.person.sprite.redraw()
-            #             if not any_children:
-            #                 person.name = '1 children'
-            #                 person.sprite.redraw()
-            #                 break
-            #             nodeGroup.remove(person.sprite)
-            #             people.remove(person)
-            #             for generation in generations:
-            #                 generation_rows[generation].sort(key=lambda x:x.sprite.pos[0])
-            #                 if person in generation_rows[generation]:
-            #                     generation_rows[generation].remove(person)
             # elif e.type == pygame.KEYDOWN and e.key == pygame.K_r:
             #     for generation in generations:
             #         # sort all rows based on their new positions
@@ -465,100 +967,6 @@ def drawTree(tree: Tree, head: Person=None):
             #     im.close()
 
 
-def press(tree: Tree, person: Person):
-    main = tk.Tk()
-    def task():
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                main.destroy()
-                pygame.quit()
-                return
-        main.after(1000, task)  # reschedule event in 1 seconds
-
-    def edit():
-        def save_and_close():
-            person.name = entry_name.get()
-            person.dob = entry_dob.get()
-            person.dod = entry_dod.get()
-            newWindow.destroy()
-
-        newWindow = tk.Toplevel(main)
-
-        tk.Label(newWindow, text='name').pack(anchor='w')
-        entry_name = tk.Entry(newWindow, width=100)
-        entry_name.pack(anchor='w', fill='x')
-        if person.name: entry_name.insert(tk.END, person.name)
-
-        tk.Label(newWindow, text='dob').pack(anchor='w')
-        entry_dob = tk.Entry(newWindow)
-        entry_dob.pack(anchor='w', fill='x')
-        if person.dob: entry_dob.insert(tk.END, person.dob)
-
-        tk.Label(newWindow, text='dod').pack(anchor='w')
-        entry_dod = tk.Entry(newWindow)
-        entry_dod.pack(anchor='w', fill='x')
-        if person.dod: entry_dod.insert(tk.END, person.dod)
-
-        tk.Button(newWindow, text='save & close', command=save_and_close).pack()
-
-
-    main.after(1000, task)
-    # for line in str(person).split('\n'):
-    #     tk.Label(main, text=line.strip()).pack()
-    tk.Label(main, text=person.name).pack()
-    if person.dob and person.dod:
-        tk.Label(main, text=f'{person.dob} - {person.dod}').pack()
-    elif person.dob:
-        tk.Label(main, text=f'b: {person.dob}').pack()
-    elif person.dod:
-        tk.Label(main, text=f'd: {person.dod}').pack()
-
-    tk.Button(main, text='edit', command=edit).pack(side='left')
-    tk.Button(main, text='close', command=main.destroy).pack(side='right')
-    main.mainloop()
-
 if __name__ == '__main__':
-    """sort_people tdd"""
-    import csv
-
-
-    person_list: list[Person] = []
-    with open('data/example1.csv') as f:
-        rdr = csv.DictReader(f)
-        for line in rdr:
-            fam = []
-            if line['family']:
-                for person in line['family'].split(','):
-                    p_rel, p_id, *notes = person.split(':')
-                    if notes:
-                        notes = notes[0]
-                    fam.append(Family(Relation[p_rel], p_id, notes=notes))
-
-            sex = Sex[line['sex']] if line['sex'] else None
-            p = Person(
-                # name
-                # sources
-                # family
-                # dob
-                # dod
-                # sex
-                # child_complete
-                # spouse_complete
-                # notes
-                # id
-                name=line['name'],
-                dob=line['dob'],
-                dod=line['dod'],
-                sex=sex,
-                family=fam,
-                child_complete=line['child complete'],
-                spouse_complete=line['spouse complete'],
-                sources=line['sources'],
-                notes=line['notes'],
-                id=line['id'] or None,
-            )
-            person_list.append(p)
-
-    family = Tree(person_list)
+    family = Tree(read_csv('data/example1.csv'))
     family.set_head('Joshua Thomas Andrews')
-
@@ -0,0 +1,165 @@
+"""Find people who have probably been put in the tree twice
+
+people are only compared with others that share a block: the same sounding
+surname, first initial and birth decade, or a parent/spouse/child in common.
+each pair in a block gets a score from 0 to 1 and anything over the threshold
+is a candidate to merge, best first
+
+    for score, a, b in find_duplicates(tree):
+        print(f'{score:.2f} {a} {b}')
+
+blocks can be scored across processes with workers, everything sent to them
+is plain tuples so there's little to pickle
+"""
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from typing import Any, Iterable, Optional
+import os
+from .family_tree import Person, Sex, year
+from .profiling import profiled
+
+
+# (id, name, given name, surname, birth year, death year, sex, relatives)
+Record = tuple[Any, str, str, str, Optional[int], Optional[int], str, frozenset]
+Candidate = tuple[float, Any, Any]
+
+soundex_codes = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def soundex(name: str) -> str:
+    """the usual four character soundex, so Smith and Smyth land together"""
+    letters = [c for c in name.lower() if c.isalpha()]
+    if not letters:
+        return ''
+    out = letters[0].upper()
+    last = soundex_codes.get(letters[0], '')
+    for c in letters[1:]:
+        code = soundex_codes.get(c, '')
+        if code and code != last:
+            out += code
+            if len(out) == 4:
+                break
+        # h and w don't split up letters with the same code, vowels do
+        if c not in 'hw':
+            last = code
+    return out.ljust(4, '0')
+
+
+def record(person: Person) -> Record:
+    """what a person is compared on"""
+    parts = person.name.lower().split()
+    relatives = frozenset(
+        fam.person_id
+        for fam in person.family
+        if fam.relation.is_parent() or fam.relation.is_child() or fam.relation.is_spouse()
+    )
+    return (
+        person.id,
+        ' '.join(parts),
+        parts[0] if parts else '',
+        parts[-1] if parts else '',
+        year(person.dob),
+        year(person.dod),
+        person.sex.name if person.sex not in (None, Sex.unknown) else '',
+        relatives,
+    )
+
+
+def blocking_keys(r: Record) -> list[tuple]:
+    _, _, given, surname, born, _, _, relatives = r
+    sound = soundex(surname)
+    initial = given[:1]
+    keys: list[tuple] = []
+    if born is None:
+        keys.append(('name', sound, initial, None))
+    else:
+        # someone born in 1899 and 1901 should still meet, so shift by half a decade too
+        keys.append(('name', sound, initial, born // 10))
+        keys.append(('name+5', sound, initial, (born + 5) // 10))
+    keys.extend(('relative', other) for other in relatives)
+    return keys
+
+
+def score(a: Record, b: Record) -> float:
+    """how likely two records are the same person, 0 when they can't be"""
+    a_id, a_name, _, _, a_born, a_died, a_sex, a_rel = a
+    b_id, b_name, _, _, b_born, b_died, b_sex, b_rel = b
+    if a_sex and b_sex and a_sex != b_sex:
+        return 0.0
+    # people that are already family (parent, child, spouse) aren't the same person
+    if b_id in a_rel or a_id in b_rel:
+        return 0.0
+
+    name = SequenceMatcher(None, a_name, b_name).ratio()
+
+    dates = []
+    for x, y in ((a_born, b_born), (a_died, b_died)):
+        if x is not None and y is not None:
+            dates.append(max(0.0, 1 - abs(x - y) / 5))
+    # unknown dates count a little towards a match but not as much as agreeing ones
+    date = sum(dates) / len(dates) if dates else 0.5
+    if dates and min(dates) == 0:
+        return 0.0
+
+    shared = len(a_rel & b_rel)
+    relatives = min(1.0, shared / 2) if a_rel and b_rel else 0.0
+
+    return round(0.55 * name + 0.3 * date + 0.15 * relatives, 4)
+
+
+def _score_blocks(blocks: list[list[Record]], threshold: float) -> list[Candidate]:
+    out = []
+    for block in blocks:
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                value = score(a, b)
+                if value >= threshold:
+                    first, second = sorted((a[0], b[0]), key=str)
+                    out.append((value, first, second))
+    return out
+
+
+@profiled()
+def find_duplicates(
+    people: Iterable[Person],
+    threshold: float=0.75,
+    workers: Optional[int]=1,
+    max_block: int=500,
+) -> list[Candidate]:
+    """likely duplicate pairs as (score, id, id), highest score first
+
+    workers is how many processes to score with (None for one per cpu).
+    blocks with more than max_block people are skipped, they're usually a very
+    common name with no dates and would take forever for nothing
+    """
+    records = [record(person) for person in people]
+    blocks: dict[tuple, list[Record]] = defaultdict(list)
+    for r in records:
+        for key in blocking_keys(r):
+            blocks[key].append(r)
+    work = [block for block in blocks.values() if 1 < len(block) <= max_block]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(work) > workers:
+        # biggest blocks first so no one process gets left with all of them at the end
+        work.sort(key=len, reverse=True)
+        chunks = [work[i::workers * 4] for i in range(workers * 4)]
+        with ProcessPoolExecutor(workers) as pool:
+            found = [c for part in pool.map(_score_blocks, chunks, [threshold] * len(chunks)) for c in part]
+    else:
+        found = _score_blocks(work, threshold)
+
+    # the same pair can turn up in more than one block
+    best: dict[tuple[Any, Any], float] = {}
+    for value, a, b in found:
+        best[a, b] = max(value, best.get((a, b), 0.0))
+    return sorted(((value, a, b) for (a, b), value in best.items()), key=lambda c: (-c[0], str(c[1]), str(c[2])))
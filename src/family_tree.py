@@ -2,13 +2,33 @@ from dataclasses import dataclass, field
 from datetime import date
 from enum import Enum
 from functools import lru_cache
-from typing import Any, ClassVar, Optional, Union
+from typing import Any, Callable, ClassVar, Iterable, Optional, Union
+import csv
 import re
+import sys
+from .profiling import profiled
 
 
 re_fix_enum = re.compile(r'<([\w\.]+): [^>]+>')
 
 
+def intern(value):
+    """keep one copy of strings that turn up over and over (ids, sources)"""
+    return sys.intern(value) if type(value) is str else value
+
+
+def year(value: Optional[str]) -> Optional[int]:
+    """the year a date starts with (1900-01-01, 1900, 1900?), None if it doesn't"""
+    match = re.match(r'\s*(\d{4})', str(value or ''))
+    return int(match.group(1)) if match else None
+
+
+def check_name(name: Any):
+    """names (and ids) go in the csv unquoted, so commas and double quotes would break it"""
+    if isinstance(name, str) and (',' in name or '"' in name):
+        raise ValueError(f'{name!r} can\'t have a comma or double quote in it')
+
+
 def escape_csv(text):
     text = text.replace('"', '""')
     if ',' in text or '\n' in text:
@@ -60,7 +80,7 @@ class Relation(Enum):
             Relation.partner,
         )
 
-@dataclass
+@dataclass(slots=True)
 class Family:
     """What relation one person has to another"""
     relation: Relation
@@ -68,6 +88,10 @@ class Family:
     person: Union['Person', None] = None
     notes: str = ''
 
+    def __post_init__(self) -> None:
+        # the same string as the other person's id rather than a copy of it
+        self.person_id = intern(self.person_id)
+
     def __str__(self) -> str:
         if self.person is None:
             return repr(self)
@@ -77,7 +101,29 @@ class Family:
         return f'Family({self.relation}, {self.person_id})'
 
 
-@dataclass
+class LazyFamily(Family):
+    """A Family that looks its person up in a tree whenever it's asked for
+
+    for trees that don't keep everyone in memory, so holding a relation never
+    keeps the other person loaded
+    """
+    __slots__ = ('tree',)
+
+    def __init__(self, tree: 'Tree', relation: Relation, person_id: Any, notes: str=''):
+        self.tree = tree
+        super().__init__(relation, person_id, None, notes)
+
+    @property
+    def person(self) -> Optional['Person']:
+        return self.tree.get(self.person_id)
+
+    @person.setter
+    def person(self, value):
+        # always looked up, the tree is what knows who this is
+        pass
+
+
+@dataclass(slots=True)
 class Person:
     """A person as seen inside a family tree"""
     name: str
@@ -105,7 +151,14 @@ class Person:
     def __post_init__(self) -> None:
         if self.id is None:
             self.id = self.name
+        self.id = intern(self.id)
         assert self.id not in Person.seen_ids
+        if isinstance(self.sources, list):
+            self.sources = [intern(source) for source in self.sources]
+        else:
+            self.sources = intern(self.sources)
+        self.child_complete = intern(self.child_complete)
+        self.spouse_complete = intern(self.spouse_complete)
 
         # if self.id is not None:
         #     Person.curr_id = max(self.id + 1, Person.curr_id)
@@ -138,15 +191,15 @@ class Person:
         out = out.replace('datetime.', '')
         return out
 
-    def save_str2(self):
+    def save_str2(self, all_relations: bool=False):
         assert '"' not in self.name and ',' not in self.name
-        print_id = None
+        print_id = ''
         if self.id != self.name:
             print_id = self.id
 
         family = []
         for fam in self.family:
-            if fam.relation.is_parent() or fam.relation.is_spouse():
+            if all_relations or fam.relation.is_parent() or fam.relation.is_spouse():
                 if fam.notes:
                     family.append(f'{fam.relation.name}:{fam.person_id}:{escape_csv(fam.notes)}')
                 else:
@@ -156,7 +209,7 @@ class Person:
             sources = ','.join(self.sources)
         else:
             sources = self.sources
-        return f'{self.name},{self.dob or ""},{self.dod or ""},{self.sex.name},{escape_csv(",".join(family))},{self.child_complete or ""},{self.spouse_complete or ""},{escape_csv(sources) or ""},{escape_csv(self.notes) or ""},{print_id}'
+        return f'{self.name},{self.dob or ""},{self.dod or ""},{self.sex.name if self.sex else ""},{escape_csv(",".join(family))},{self.child_complete or ""},{self.spouse_complete or ""},{escape_csv(sources) or ""},{escape_csv(self.notes) or ""},{print_id}'
 
     def get_relation(self, other: 'Person'):
         for fam in self.family:
@@ -250,6 +303,76 @@ class Person:
         ]
 
 
+siblings = (Relation.sibling, Relation.step_sibling)
+
+
+def relink_siblings(person: Person, get: Callable[[Any], Optional[Person]]):
+    """work out someone's siblings again from their parents, the same way Tree.connect does
+
+    for when their parents change, get looks people up (e.g. Tree.get)
+    """
+    for fam in person.family:
+        if fam.relation in siblings:
+            other = get(fam.person_id)
+            if other is not None:
+                other.family = [f for f in other.family if not (f.person_id == person.id and f.relation in siblings)]
+    person.family = [fam for fam in person.family if fam.relation not in siblings]
+
+    shared: dict[Any, int] = {}
+    for fam in person.parents:
+        parent = get(fam.person_id)
+        if parent is None:
+            continue
+        for child in parent.children:
+            if child.person_id != person.id:
+                shared[child.person_id] = shared.get(child.person_id, 0) + 1
+    for other_id, count in shared.items():
+        other = get(other_id)
+        if other is None:
+            continue
+        relation = Relation.sibling if count == 2 else Relation.step_sibling
+        person.family.append(Family(relation, other.id, other))
+        other.family.append(Family(relation, person.id, person))
+
+
+csv_columns = ['name', 'dob', 'dod', 'sex', 'family', 'child complete', 'spouse complete', 'sources', 'notes', 'id']
+
+
+def person_from_row(line: dict[str, str]) -> Person:
+    """Make a person from one row of a family csv"""
+    fam = []
+    if line['family']:
+        for person in line['family'].split(','):
+            p_rel, p_id, *notes = person.split(':')
+            fam.append(Family(Relation[p_rel], p_id, notes=notes[0] if notes else ''))
+
+    sex = Sex[line['sex']] if line['sex'] else Sex.unknown
+    return Person(
+        name=line['name'],
+        dob=line['dob'],
+        dod=line['dod'],
+        sex=sex,
+        family=fam,
+        child_complete=line['child complete'],
+        spouse_complete=line['spouse complete'],
+        sources=line['sources'],
+        notes=line['notes'],
+        id=line['id'] or None,
+    )
+
+
+def read_csv(path) -> list[Person]:
+    with open(path, newline='') as f:
+        return [person_from_row(line) for line in csv.DictReader(f)]
+
+
+def write_csv(path, people: Iterable[Person]):
+    with open(path, 'w', newline='') as f:
+        f.write(','.join(csv_columns) + '\n')
+        for person in people:
+            f.write(person.save_str2() + '\n')
+
+
 class Tree:
     """A family tree"""
     def __init__(self, tree=None):
@@ -272,6 +395,7 @@ class Tree:
         assert head is not None
         self._head = head
 
+    @profiled()
     def fix(self):
         for node in self.tree:
             for fam in node.family:
@@ -283,13 +407,13 @@ class Tree:
                     elif fam.person.sex == Sex.female:
                         fam.relation = Relation.mother
 
+    @profiled()
     def connect(self):
         for node in self.tree:
             for family in node.family:
                 rel = self.get(family.person_id)
                 # print(f'{node.id=}')
                 # print(f'{family.person_id=}')
-                print(node.id, family.person_id)
                 assert rel is not None
                 # make sure spouse is bidirectional:
                 if family.relation.is_spouse():
@@ -324,23 +448,36 @@ class Tree:
                         rel.family.append(
                             Family(Relation.spouse, node.id)
                         )
-            # add sibling connector
-            for node2 in self.tree:
-                if node.id == node2.id:
-                    continue
-                node_parents = [f.person_id for f in node.family if f.relation.is_parent()]
-                node2_parents = [f.person_id for f in node2.family if f.relation.is_parent()]
-
-                same = len([x for x in node_parents if x in node2_parents])
-                if same == 2:
-                    node.family.append(
-                        Family(Relation.sibling, node2.id)
-                    )
-                elif same == 1:
-                    node.family.append(
-                        Family(Relation.step_sibling, node2.id)
-                    )
-
+            self.__add_siblings(node)
+
+    @profiled('Tree.add_siblings')
+    def __add_siblings(self, node: Person):
+        """add sibling connector"""
+        for node2 in self.tree:
+            if node.id == node2.id:
+                continue
+            node_parents = [f.person_id for f in node.family if f.relation.is_parent()]
+            node2_parents = [f.person_id for f in node2.family if f.relation.is_parent()]
+
+            same = len([x for x in node_parents if x in node2_parents])
+            existing = next((f for f in node.family if f.person_id == node2.id and f.relation in siblings), None)
+            if existing is not None:
+                # their parents may have changed since they were linked
+                if same == 0:
+                    node.family.remove(existing)
+                else:
+                    existing.relation = Relation.sibling if same == 2 else Relation.step_sibling
+                continue
+            if same == 2:
+                node.family.append(
+                    Family(Relation.sibling, node2.id)
+                )
+            elif same == 1:
+                node.family.append(
+                    Family(Relation.step_sibling, node2.id)
+                )
+
+    @profiled()
     def search_names(self, name: str) -> set[Person]:
         """Get a list of people who have a partial match to a name"""
         nodes: set[Person] = set()
@@ -351,6 +488,7 @@ class Tree:
 
         return nodes
 
+    @profiled()
     def explore(self, head: Optional[Person]=None, levels=None) -> set[Person]:
         head = head or self.head
         nodes: set[Person] = {head}
@@ -376,6 +514,7 @@ class Tree:
                     if fam.person_id == p_id:
                         fam.person_id = p_name
 
+    @profiled()
     def explore_up(self, head: Optional[Person]=None, levels=None) -> set[Person]:
         """get the family tree upwards from the head"""
         if levels == 0:
@@ -396,6 +535,7 @@ class Tree:
 
         return nodes
 
+    @profiled()
     def explore_down(self, head: Optional[Person]=None, levels=None) -> set[Person]:
         """get the family tree downwards from the head"""
         if levels == 0:
@@ -418,6 +558,29 @@ class Tree:
 
         return nodes
 
+    @profiled()
+    def ancestors(self, head: Optional[Person]=None, levels=None) -> set[Person]:
+        """everyone head is descended from, not including head"""
+        return self.__walk(head or self.head, levels, lambda person: person.parents)
+
+    @profiled()
+    def descendants(self, head: Optional[Person]=None, levels=None) -> set[Person]:
+        """everyone descended from head, not including head"""
+        return self.__walk(head or self.head, levels, lambda person: person.children)
+
+    def __walk(self, head: Person, levels, step) -> set[Person]:
+        nodes: set[Person] = set()
+        level = [head]
+        while level and levels != 0:
+            next_level = []
+            for person in level:
+                for fam in step(person):
+                    if fam.person not in nodes:
+                        nodes.add(fam.person)
+                        next_level.append(fam.person)
+            level = next_level
+            levels = levels - 1 if levels else levels
+        return nodes
 
     def get_incomplete_nodes(self, levels=None) -> set[Person]:
         nodes: set[Person] = set()
@@ -430,21 +593,27 @@ class Tree:
 
         return nodes
 
-    def generation(self, p1: Person, p2: 'Person') -> int:
-        level: set[tuple['Person', int]] = {(p1, 0)}
-        next_level: set[tuple['Person', int]] = set()
+    @profiled()
+    def generation(self, p1: Person, p2: 'Person') -> Optional[int]:
+        """how many generations above p1 that p2 is, None if they aren't related by blood
 
-        while True:
-            for item in level:
-                if p2 == item[0]:
-                    return item[1]
+        counted along the shortest line of parents and children between them
+        """
+        found: dict[Any, int] = {p1.id: 0}
+        level = [p1]
+        while level:
+            next_level = []
             for person in level:
-                for fam in person[0].parents:
-                    next_level.add((fam.person, person[1]+1))
-                for fam in person[0].children:
-                    next_level.add((fam.person, person[1]-1))
+                if person == p2:
+                    return found[person.id]
+                for fam in person.parents + person.children:
+                    # each person only once, a loop of relations would go round forever otherwise
+                    if fam.person_id in found:
+                        continue
+                    found[fam.person_id] = found[person.id] + (1 if fam.relation.is_parent() else -1)
+                    next_level.append(fam.person)
             level = next_level
-            next_level = set()
+        return None
 
     def update(self, other: 'Tree', this_id: Any, other_id: Any):
         people_list = [(self.get(this_id), other.get(other_id))]
@@ -475,27 +644,26 @@ class Tree:
 
         print(same)
 
-    def __dfs(self, search: Person, levels: int, head: Person=None):
-        next_level = levels - 1
-        head = head or self.head
-        if head == search:
-            return [head]
-        if next_level == 0:
-            return None
-
-        for p1 in head.family:
-            if p1.relation.is_child() or p1.relation.is_parent():
-                path = self.__dfs(search, next_level, p1.person)
-                if path:
-                    return [head] + path
-        return None
-
+    @profiled('Tree.path')
     @lru_cache
     def path(self, p1: Person, p2: Person):
-        for i in range(1, len(self.tree)):
-            path = self.__dfs(p2, i, head=p1)
-            if path and path[-1] == p2:
-                return path
+        """the shortest line of parents and children from p1 to p2, None if there isn't one"""
+        previous: dict[Any, Optional[Person]] = {p1.id: None}
+        level = [p1]
+        while level:
+            next_level = []
+            for person in level:
+                if person == p2:
+                    path = [person]
+                    while previous[path[-1].id] is not None:
+                        path.append(previous[path[-1].id])
+                    return path[::-1]
+                for fam in person.family:
+                    if (fam.relation.is_child() or fam.relation.is_parent()) and fam.person_id not in previous:
+                        previous[fam.person_id] = person
+                        next_level.append(fam.person)
+            level = next_level
+        return None
 
 
     def add(self, node: Person) -> None:
@@ -503,6 +671,7 @@ class Tree:
         self.connect()
         self.fix()
 
+    @profiled()
     def get(self, id: Any) -> Person:
         for node in self.tree:
             if node.id == id:
@@ -0,0 +1,258 @@
+"""Read and write GEDCOM files a record at a time
+
+only one record of the file is held in memory while reading, people are kept
+as their fields and families as a few ids each and they're linked up once the
+whole file is read.
+writing goes through the people once and then writes out the families
+
+    people = read_gedcom('big.ged')
+    people = read_gedcom('out.ged', use_refn=True)   # one we wrote, ids as they were
+    write_gedcom(Tree(people), 'out.ged')
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Any, Iterable, Iterator, Optional, TextIO
+from .family_tree import Family, Person, Relation, Sex
+from .profiling import profiled
+
+
+gedcom_sex = {'M': Sex.male, 'F': Sex.female, 'U': Sex.unknown, 'X': Sex.other}
+sex_gedcom = {sex: letter for letter, sex in gedcom_sex.items()}
+
+Line = tuple[int, Optional[str], str, str]
+
+
+def _records(f: TextIO) -> Iterator[list[Line]]:
+    """split a file into level 0 records of (level, xref, tag, value)"""
+    record: list[Line] = []
+    for raw in f:
+        line = raw.strip()
+        if not line:
+            continue
+        level, _, rest = line.partition(' ')
+        xref = None
+        if rest.startswith('@'):
+            xref, _, rest = rest.partition(' ')
+        tag, _, value = rest.partition(' ')
+        if level == '0' and record:
+            yield record
+            record = []
+        record.append((int(level), xref, tag, value))
+    if record:
+        yield record
+
+
+def _xref(value: str) -> str:
+    return value.strip('@')
+
+
+def from_gedcom_date(value: str) -> str:
+    """1 JAN 1900 -> 1900-01-01, anything less exact is kept as it is"""
+    try:
+        return datetime.strptime(value.title(), '%d %b %Y').strftime('%Y-%m-%d')
+    except ValueError:
+        return value
+
+
+def to_gedcom_date(value: str) -> str:
+    """1900-01-01 -> 1 JAN 1900, anything else is kept as it is"""
+    try:
+        date = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return value
+    return f'{date.day} {date.strftime("%b").upper()} {date.year}'
+
+
+def _person(record: list[Line]) -> tuple[dict[str, Any], Optional[str], set[str]]:
+    """an INDI record as the fields of a person (with no family yet), their REFN and the families they were adopted into"""
+    fields: dict[str, Any] = {'sources': [], 'notes': ''}
+    adopted: set[str] = set()
+    refn = None
+    # the tag of the last line at each level so we know what a DATE belongs to
+    context: list[str] = []
+    note = None
+    famc = None
+
+    for level, _, tag, value in record[1:]:
+        del context[level - 1:]
+        context.append(tag)
+        parent = context[-2] if len(context) > 1 else None
+
+        if tag in ('CONT', 'CONC') and note is not None:
+            fields['notes'] += ('\n' if tag == 'CONT' else '') + value
+            continue
+        note = None
+
+        if level == 1:
+            if tag == 'NAME' and 'name' not in fields:
+                # our csv can't have commas or double quotes in names, nicknames like John "Jack" /Smith/ keep single ones
+                value = value.replace('/', ' ').replace(',', ' ').replace('"', "'")
+                fields['name'] = ' '.join(value.split())
+            elif tag == 'SEX':
+                fields['sex'] = gedcom_sex.get(value[:1].upper(), Sex.unknown)
+            elif tag == 'NOTE':
+                if fields['notes']:
+                    fields['notes'] += '\n'
+                fields['notes'] += value
+                note = True
+            elif tag == 'SOUR':
+                fields['sources'].append(_xref(value))
+            elif tag == 'REFN':
+                refn = value
+            elif tag == 'FAMC':
+                famc = _xref(value)
+        elif level == 2:
+            if tag == 'DATE' and parent == 'BIRT':
+                fields['dob'] = from_gedcom_date(value)
+            elif tag == 'DATE' and parent == 'DEAT':
+                fields['dod'] = from_gedcom_date(value)
+            elif tag == 'PEDI' and parent == 'FAMC' and value.lower() == 'adopted':
+                adopted.add(famc)
+
+    return fields, refn, adopted
+
+
+@profiled()
+def read_gedcom(path, prefix: str='', use_refn: bool=False) -> list[Person]:
+    """people from a GEDCOM file, connected up but not yet in a Tree
+
+    ids are the record's xref with prefix in front. with use_refn they come from
+    REFN instead (which is where write_gedcom puts them), but only for REFNs
+    that turn up once in the file, GEDCOM doesn't say they have to be unique
+    """
+    # xref -> (fields, REFN), made into people once we know which REFNs are unique
+    records: dict[str, tuple[dict[str, Any], Optional[str]]] = {}
+    people: dict[str, Person] = {}
+    # xref -> (husband, wife, children)
+    families: dict[str, tuple[Optional[str], Optional[str], list[str]]] = {}
+    adoptions: set[tuple[str, str]] = set()
+
+    with open(path, encoding='utf-8-sig', errors='replace') as f:
+        for record in _records(f):
+            _, xref, tag, _ = record[0]
+            if tag == 'INDI' and xref:
+                fields, refn, adopted = _person(record)
+                records[_xref(xref)] = (fields, refn)
+                adoptions.update((_xref(xref), fam) for fam in adopted)
+            elif tag == 'FAM' and xref:
+                husband = wife = None
+                children = []
+                for level, _, sub, value in record[1:]:
+                    if level != 1:
+                        continue
+                    if sub == 'HUSB':
+                        husband = _xref(value)
+                    elif sub == 'WIFE':
+                        wife = _xref(value)
+                    elif sub == 'CHIL':
+                        children.append(_xref(value))
+                families[_xref(xref)] = (husband, wife, children)
+
+    refns = Counter(refn for _, refn in records.values() if refn)
+    for xref, (fields, refn) in records.items():
+        person_id = refn if use_refn and refn and refns[refn] == 1 else prefix + xref
+        fields.setdefault('name', person_id)
+        people[xref] = Person(id=person_id, **fields)
+
+    # now everyone is known, turn the families into relations
+    for fam_id, (husband, wife, children) in families.items():
+        parents = [people[p] for p in (husband, wife) if p in people]
+        if len(parents) == 2:
+            parents[0].family.append(Family(Relation.spouse, parents[1].id, parents[1]))
+        for child_xref in children:
+            child = people.get(child_xref)
+            if child is None:
+                continue
+            relation = Relation.adopted_parent if (child_xref, fam_id) in adoptions else Relation.parent
+            for parent in parents:
+                if len(child.parents) < 2 and not any(f.person_id == parent.id for f in child.family):
+                    child.family.append(Family(relation, parent.id, parent))
+
+    return list(people.values())
+
+
+def _family_key(ids: Iterable[Any]) -> tuple[str, ...]:
+    return tuple(sorted(str(i) for i in ids))
+
+
+@profiled()
+def write_gedcom(people: Iterable[Person], path):
+    """write people (with their relations connected, e.g. from a Tree) as GEDCOM 5.5.1"""
+    xrefs: dict[Any, str] = {}
+    # parent ids -> (xref, children xrefs)
+    families: dict[tuple[str, ...], tuple[str, list[str]]] = {}
+    # who the parents in each family are, for HUSB/WIFE
+    family_parents: dict[tuple[str, ...], list[tuple[str, Sex]]] = {}
+
+    def person_xref(person_id: Any) -> str:
+        if person_id not in xrefs:
+            xrefs[person_id] = f'I{len(xrefs) + 1}'
+        return xrefs[person_id]
+
+    def family_xref(parents: list[Person]) -> str:
+        key = _family_key(p.id for p in parents)
+        if key not in families:
+            families[key] = (f'F{len(families) + 1}', [])
+            family_parents[key] = [(person_xref(p.id), p.sex) for p in parents]
+        return families[key][0]
+
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('0 HEAD\n1 SOUR better-family-tree\n1 GEDC\n2 VERS 5.5.1\n2 FORM LINEAGE-LINKED\n1 CHAR UTF-8\n')
+
+        for person in people:
+            f.write(f'0 @{person_xref(person.id)}@ INDI\n')
+            f.write(f'1 NAME {person.name}\n')
+            if person.sex:
+                f.write(f'1 SEX {sex_gedcom[person.sex]}\n')
+            if person.dob and person.dob != 'None':
+                f.write(f'1 BIRT\n2 DATE {to_gedcom_date(person.dob)}\n')
+            if person.dod and person.dod != 'None':
+                f.write(f'1 DEAT\n2 DATE {to_gedcom_date(person.dod)}\n')
+            f.write(f'1 REFN {person.id}\n')
+
+            parents = [fam for fam in person.parents if fam.person is not None]
+            if parents:
+                key = _family_key(fam.person_id for fam in parents)
+                fam_xref = family_xref([fam.person for fam in parents])
+                families[key][1].append(person_xref(person.id))
+                f.write(f'1 FAMC @{fam_xref}@\n')
+                if any(fam.relation == Relation.adopted_parent for fam in parents):
+                    f.write('2 PEDI adopted\n')
+
+            own = []
+            for fam in person.spouses:
+                if fam.person is not None:
+                    own.append(family_xref([person, fam.person]))
+            for fam in person.children:
+                child = fam.person
+                if child is not None:
+                    own.append(family_xref([p.person for p in child.parents if p.person is not None]))
+            for fam_xref in dict.fromkeys(own):
+                f.write(f'1 FAMS @{fam_xref}@\n')
+
+            sources = person.sources.split(',') if isinstance(person.sources, str) else person.sources
+            for source in sources:
+                if source:
+                    f.write(f'1 SOUR {source}\n')
+            if person.notes:
+                first, *rest = person.notes.split('\n')
+                f.write(f'1 NOTE {first}\n')
+                for line in rest:
+                    f.write(f'2 CONT {line}\n')
+
+        for key, (fam_xref, children) in families.items():
+            f.write(f'0 @{fam_xref}@ FAM\n')
+            parents = family_parents[key]
+            husband = [x for x, sex in parents if sex == Sex.male]
+            wife = [x for x, sex in parents if sex == Sex.female]
+            other = [x for x, sex in parents if sex not in (Sex.male, Sex.female)]
+            for x in other:
+                (wife if husband and not wife else husband).append(x)
+            for x in husband[:1]:
+                f.write(f'1 HUSB @{x}@\n')
+            for x in (husband[1:] + wife)[:1]:
+                f.write(f'1 WIFE @{x}@\n')
+            for child in children:
+                f.write(f'1 CHIL @{child}@\n')
+
+        f.write('0 TRLR\n')
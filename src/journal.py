@@ -0,0 +1,361 @@
+"""Keep edits to a tree in an append only journal next to its csv
+
+every change is one line of json on the end of <csv>.journal, so saving an
+edit doesn't mean writing the whole tree out again. loading reads the csv and
+replays the journal over it, and compact() folds the journal back into the csv
+
+    tree, journal = load('data/example1.csv')
+    journal.set(tree.get('Joshua Thomas Andrews'), 'dob', '1990-01-01')
+    journal.undo()
+"""
+from typing import Any, Optional
+import csv
+import json
+import os
+import sys
+from .family_tree import Family, Person, Relation, Sex, Tree, check_name, csv_columns, person_from_row, read_csv, relink_siblings, siblings, write_csv
+from .profiling import profiled
+
+
+# fields that can be changed with set
+fields = ('name', 'dob', 'dod', 'sex', 'child_complete', 'spouse_complete', 'sources', 'notes')
+
+
+def person_row(person: Person) -> dict[str, str]:
+    """a person as the row of the csv they'd be saved as"""
+    return dict(zip(csv_columns, next(csv.reader([person.save_str2()]))))
+
+
+# what a relation looks like from the other side, as Tree.connect adds it
+# (which makes any parent's side a plain child, adopted or not)
+_reverse = {
+    Relation.parent: Relation.child,
+    Relation.father: Relation.child,
+    Relation.mother: Relation.child,
+    Relation.child: Relation.parent,
+    Relation.adopted_parent: Relation.child,
+    Relation.adopted_child: Relation.adopted_parent,
+    Relation.spouse: Relation.spouse,
+    Relation.partner: Relation.partner,
+}
+
+
+def _relink(tree: Tree, person: Person, relation: Relation, other: Person):
+    """if a parent relation between two people changed, the child's siblings have too"""
+    if relation.is_parent():
+        relink_siblings(person, tree.get)
+    elif relation.is_child():
+        relink_siblings(other, tree.get)
+
+
+def _fix_parent(fam: Family):
+    """parent -> father or mother, the same as Tree.fix"""
+    if fam.relation == Relation.parent and fam.person is not None:
+        if fam.person.sex == Sex.male:
+            fam.relation = Relation.father
+        elif fam.person.sex == Sex.female:
+            fam.relation = Relation.mother
+
+
+def _link(tree: Tree, person: Person):
+    """what Tree.connect and Tree.fix do, but only for one person's relations
+
+    so an edit never has to go over the whole tree
+    """
+    for fam in person.family:
+        if fam.relation in siblings:
+            continue
+        other = fam.person = fam.person or _get(tree, fam.person_id)
+        reverse = _reverse.get(fam.relation)
+        if reverse is not None and not any(f.person_id == person.id and f.relation not in siblings for f in other.family):
+            other.family.append(Family(reverse, person.id, person))
+        for back in other.family:
+            if back.person_id == person.id:
+                back.person = person
+                _fix_parent(back)
+        _fix_parent(fam)
+    if person.parents:
+        relink_siblings(person, tree.get)
+
+
+class StaleEntry(Exception):
+    """A journal entry that doesn't fit the tree any more, e.g. the person it
+    changes has since been taken out of the csv by hand"""
+
+
+def _get(tree: Tree, person_id: Any) -> Person:
+    person = tree.get(person_id)
+    if person is None:
+        raise StaleEntry(f'no one with id {person_id!r}')
+    return person
+
+
+def _value(field: str, value: Any) -> Any:
+    return value.name if field == 'sex' and isinstance(value, Sex) else value
+
+
+class Journal:
+    """An append only log of changes to a tree that can be undone and redone
+
+    after compact_every changes the journal is folded into the csv and emptied
+    (pass None to only compact when asked to). that also forgets the undo history
+    """
+    def __init__(self, tree: Tree, csv_path, compact_every: Optional[int]=1000):
+        self.tree = tree
+        self.csv_path = csv_path
+        self.path = f'{csv_path}.journal'
+        self.compact_every = compact_every
+        self.done: list[dict] = []
+        self.undone: list[dict] = []
+        # entries that couldn't be applied, they stay on done/undone so undo lines up with the file
+        self.skipped: list[dict] = []
+        self.entries = 0
+        self.file = None
+
+    def _write(self, entry: dict):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        self.entries += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @profiled('Journal.replay')
+    def replay(self):
+        """apply everything in the journal file to the tree
+
+        entries that don't fit the tree any more are skipped (and kept in skipped)
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self.entries += 1
+                if entry['op'] == 'undo':
+                    self._undo()
+                elif entry['op'] == 'redo':
+                    self._redo()
+                else:
+                    self.done.append(entry)
+                    self.undone.clear()
+                    try:
+                        self._apply(entry)
+                    except StaleEntry as e:
+                        self._skip(entry, e)
+
+    def record(self, entry: dict):
+        """apply a change to the tree and add it to the journal"""
+        self._apply(entry)
+        self.done.append(entry)
+        self.undone.clear()
+        self._write(entry)
+        if self.compact_every is not None and self.entries >= self.compact_every:
+            self.compact()
+
+    def undo(self) -> Optional[dict]:
+        """take back the last change, returns it (or None if there was nothing to undo)"""
+        if not self.done:
+            return None
+        entry = self._undo()
+        self._write({'op': 'undo'})
+        return entry
+
+    def redo(self) -> Optional[dict]:
+        if not self.undone:
+            return None
+        entry = self._redo()
+        self._write({'op': 'redo'})
+        return entry
+
+    def _undo(self) -> dict:
+        entry = self.done.pop()
+        self.undone.append(entry)
+        try:
+            self._apply(self.inverse(entry))
+        except StaleEntry as e:
+            self._skip(entry, e)
+        return entry
+
+    def _redo(self) -> dict:
+        entry = self.undone.pop()
+        self.done.append(entry)
+        try:
+            self._apply(entry)
+        except StaleEntry as e:
+            self._skip(entry, e)
+        return entry
+
+    def _skip(self, entry: dict, error: StaleEntry):
+        self.skipped.append(entry)
+        print(f'skipping journal entry {entry["op"]}: {error}', file=sys.stderr)
+
+    @profiled('Journal.compact')
+    def compact(self):
+        """write the tree out to the csv and start an empty journal"""
+        self.close()
+        tmp = f'{self.csv_path}.tmp'
+        write_csv(tmp, sorted(self.tree, key=lambda p: str(p.id)))
+        os.replace(tmp, self.csv_path)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.entries = 0
+        self.done.clear()
+        self.undone.clear()
+
+    # the changes themselves
+
+    def set(self, person: Person, field: str, value: Any):
+        """raises ValueError for a name that couldn't be saved to the csv"""
+        assert field in fields, field
+        if field == 'name':
+            check_name(value)
+        old = _value(field, getattr(person, field))
+        new = _value(field, value)
+        if old != new:
+            self.record({'op': 'set', 'id': person.id, 'field': field, 'old': old, 'new': new})
+
+    def add_person(self, person: Person) -> Person:
+        """add someone, the tree gets a copy made from the journal row (the same as a replay would) which is returned"""
+        row = person_row(person)
+        Person.seen_ids.discard(person.id)
+        self.record({'op': 'add_person', 'row': row, 'edges': []})
+        return self.tree.get(row['id'] or row['name'])
+
+    def remove_person(self, person: Person):
+        # relations other people have to them would be lost with them otherwise
+        edges = [
+            [fam.person_id, other.relation.name, other.notes]
+            for fam in person.family
+            if fam.person is not None
+            for other in fam.person.family
+            if other.person_id == person.id and (other.relation.is_parent() or other.relation.is_spouse())
+        ]
+        self.record({'op': 'remove_person', 'row': person_row(person), 'edges': edges})
+
+    def add_relation(self, person: Person, relation: Relation, other: Person, notes: str=''):
+        self.record({'op': 'add_relation', 'id': person.id, 'relation': relation.name, 'other': other.id, 'notes': notes})
+
+    def remove_relation(self, person: Person, other: Person):
+        fam = next((f for f in person.family if f.person_id == other.id), None)
+        if fam is not None:
+            self.record({'op': 'remove_relation', 'id': person.id, 'relation': fam.relation.name, 'other': other.id, 'notes': fam.notes})
+
+    def rename(self, person: Person, new: Any):
+        if new is None:
+            new = person.name
+        check_name(new)
+        self.record({'op': 'rename', 'old': person.id, 'new': new})
+
+    @staticmethod
+    def inverse(entry: dict) -> dict:
+        """the change that takes entry back"""
+        op = entry['op']
+        if op == 'set':
+            return {**entry, 'old': entry['new'], 'new': entry['old']}
+        if op == 'rename':
+            return {**entry, 'old': entry['new'], 'new': entry['old']}
+        swap = {
+            'add_person': 'remove_person',
+            'remove_person': 'add_person',
+            'add_relation': 'remove_relation',
+            'remove_relation': 'add_relation',
+        }
+        return {**entry, 'op': swap[op]}
+
+    def _apply(self, entry: dict):
+        tree = self.tree
+        op = entry['op']
+        if op == 'set':
+            value = entry['new']
+            if entry['field'] == 'sex':
+                value = Sex[value] if value else Sex.unknown
+            if entry['field'] == 'name':
+                try:
+                    check_name(value)
+                except ValueError as error:
+                    # from before names were checked, it would stop the csv being written
+                    raise StaleEntry(str(error))
+            setattr(_get(tree, entry['id']), entry['field'], value)
+
+        elif op == 'add_person':
+            person_id = entry['row']['id'] or entry['row']['name']
+            if tree.get(person_id) is not None:
+                raise StaleEntry(f'{person_id!r} is already in the tree')
+            # everyone is looked up before anything changes so a stale entry leaves the tree alone
+            edges = [(_get(tree, other_id), Relation[relation], notes) for other_id, relation, notes in entry['edges']]
+            person = person_from_row(entry['row'])
+            try:
+                for fam in person.family:
+                    fam.person = _get(tree, fam.person_id)
+            except StaleEntry:
+                Person.seen_ids.discard(person.id)
+                raise
+            tree.tree.add(person)
+            for other, relation, notes in edges:
+                other.family.append(Family(relation, person.id, person, notes))
+                reverse = _reverse.get(relation)
+                if reverse is not None and not any(fam.person_id == other.id for fam in person.family):
+                    person.family.append(Family(reverse, other.id, other))
+            _link(tree, person)
+            for other, relation, _ in edges:
+                _relink(tree, other, relation, person)
+
+        elif op == 'remove_person':
+            person = _get(tree, entry['row']['id'] or entry['row']['name'])
+            for other in tree:
+                other.family = [fam for fam in other.family if fam.person_id != person.id]
+            # their children are left with one parent fewer
+            for fam in person.children:
+                child = tree.get(fam.person_id)
+                if child is not None:
+                    relink_siblings(child, tree.get)
+            tree.tree.discard(person)
+            Person.seen_ids.discard(person.id)
+            if tree._head is person:
+                tree._head = None
+
+        elif op == 'add_relation':
+            person = _get(tree, entry['id'])
+            other = _get(tree, entry['other'])
+            relation = Relation[entry['relation']]
+            fam = Family(relation, other.id, other, entry['notes'])
+            person.family.append(fam)
+            reverse = _reverse.get(relation)
+            if reverse is not None and not any(f.person_id == person.id and f.relation not in siblings for f in other.family):
+                other.family.append(Family(reverse, person.id, person))
+            _fix_parent(fam)
+            for back in other.family:
+                if back.person_id == person.id:
+                    _fix_parent(back)
+            _relink(tree, person, relation, other)
+
+        elif op == 'remove_relation':
+            person = _get(tree, entry['id'])
+            other = _get(tree, entry['other'])
+            person.family = [fam for fam in person.family if fam.person_id != other.id]
+            other.family = [fam for fam in other.family if fam.person_id != person.id]
+            _relink(tree, person, Relation[entry['relation']], other)
+
+        elif op == 'rename':
+            _get(tree, entry['old'])
+            if tree.get(entry['new']) is not None:
+                raise StaleEntry(f'{entry["new"]!r} is already in the tree')
+            tree.rename(entry['old'], entry['new'])
+
+        else:
+            raise ValueError(f'unknown journal entry {op!r}')
+
+
+def load(csv_path, compact_every: Optional[int]=1000) -> tuple[Tree, Journal]:
+    """read a csv and everything journalled since it was last written"""
+    tree = Tree(read_csv(csv_path))
+    journal = Journal(tree, csv_path, compact_every)
+    journal.replay()
+    return tree, journal
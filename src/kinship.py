@@ -0,0 +1,218 @@
+"""Kinship and inbreeding coefficients
+
+the kinship of two people is the chance that an allele picked at random from
+each of them is identical by descent, a person's inbreeding coefficient is the
+kinship of their parents. only blood parents count, adopted ones are left out
+
+    ped = Pedigree(tree)
+    inbreeding(ped)['Joshua Thomas Andrews']
+    kinship(ped, [('Joshua Thomas Andrews', 'Emily Sarah Andrews')])
+
+kinship between a handful of people is worked out one generation at a time
+with numpy over just their ancestors, inbreeding for everyone uses the
+Meuwissen and Luo (1992) method which only ever walks each person's ancestors
+"""
+from collections import defaultdict
+from typing import Any, Iterable, Optional
+import heapq
+import numpy as np
+from .family_tree import Person, Relation, Tree
+from .profiling import profiled
+
+
+blood_parents = (Relation.parent, Relation.father, Relation.mother)
+# bigger than this and kinship goes through the sparse method instead of a matrix
+dense_limit = 5000
+
+
+class Pedigree:
+    """Everyone's blood parents as indexes, ordered so parents come before their children
+
+    father and mother are just the two parent slots, -1 when they aren't known
+    """
+    def __init__(self, people: Iterable[Person]):
+        people = list(people)
+        known = {person.id for person in people}
+        parents: dict[Any, list[Any]] = {
+            person.id: [
+                fam.person_id
+                for fam in person.family
+                if fam.relation in blood_parents and fam.person_id in known
+            ][:2]
+            for person in people
+        }
+
+        # how many generations of known ancestors everyone has, founders are 0
+        depth: dict[Any, int] = {}
+        waiting: dict[Any, list[Any]] = defaultdict(list)
+        remaining = {person_id: len(ids) for person_id, ids in parents.items()}
+        level = [person_id for person_id, count in remaining.items() if count == 0]
+        for person_id, ids in parents.items():
+            for parent_id in ids:
+                waiting[parent_id].append(person_id)
+        generation = 0
+        while level:
+            next_level = []
+            for person_id in level:
+                depth[person_id] = generation
+                for child_id in waiting[person_id]:
+                    remaining[child_id] -= 1
+                    if remaining[child_id] == 0:
+                        next_level.append(child_id)
+            level = next_level
+            generation += 1
+        if len(depth) != len(parents):
+            stuck = sorted(str(person_id) for person_id in parents.keys() - depth.keys())
+            raise ValueError(f'people are their own ancestors: {", ".join(stuck[:10])}')
+
+        self.ids: list[Any] = sorted(parents, key=lambda person_id: (depth[person_id], str(person_id)))
+        self.index: dict[Any, int] = {person_id: i for i, person_id in enumerate(self.ids)}
+        self.depth = np.array([depth[person_id] for person_id in self.ids], dtype=np.int32)
+        self.father = np.full(len(self.ids), -1, dtype=np.int64)
+        self.mother = np.full(len(self.ids), -1, dtype=np.int64)
+        for person_id, ids in parents.items():
+            i = self.index[person_id]
+            if ids:
+                self.father[i] = self.index[ids[0]]
+            if len(ids) > 1:
+                self.mother[i] = self.index[ids[1]]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def ancestors(self, indexes: Iterable[int]) -> np.ndarray:
+        """indexes and all their ancestors, in pedigree order"""
+        found = set(indexes)
+        todo = list(found)
+        while todo:
+            i = todo.pop()
+            for parent in (self.father[i], self.mother[i]):
+                if parent >= 0 and parent not in found:
+                    found.add(int(parent))
+                    todo.append(int(parent))
+        return np.array(sorted(found), dtype=np.int64)
+
+
+@profiled()
+def kinship_matrix(ped: Pedigree, indexes: Optional[np.ndarray]=None) -> np.ndarray:
+    """the kinship of everyone in indexes (which have to include all their ancestors) with each other
+
+    each generation is worked out in one go from the ones before it
+    """
+    if indexes is None:
+        indexes = np.arange(len(ped), dtype=np.int64)
+    n = len(indexes)
+    if not n:
+        return np.zeros((0, 0))
+    local = np.full(len(ped) + 1, n, dtype=np.int64)
+    local[indexes] = np.arange(n)
+    # an unknown parent (-1) ends up pointing at the extra row of zeros at n
+    father = local[ped.father[indexes]]
+    mother = local[ped.mother[indexes]]
+    depth = ped.depth[indexes]
+
+    matrix = np.zeros((n + 1, n + 1))
+    starts = np.flatnonzero(np.diff(depth, prepend=-1, append=depth[-1] + 1))
+    for start, end in zip(starts, starts[1:]):
+        layer = np.arange(start, end)
+        f, m = father[layer], mother[layer]
+        # everyone earlier isn't descended from this generation so goes through its parents
+        matrix[start:end, :start] = 0.5 * (matrix[f, :start] + matrix[m, :start])
+        matrix[:start, start:end] = matrix[start:end, :start].T
+        # people in the same generation aren't each other's ancestors either
+        block = 0.5 * (matrix[start:end][:, f] + matrix[start:end][:, m]).T
+        block[np.diag_indices_from(block)] = 0.5 * (1 + matrix[f, m])
+        matrix[start:end, start:end] = block
+    return matrix[:n, :n]
+
+
+def _lrow(ped: Pedigree, i: int) -> dict[int, float]:
+    """row i of L in A = L D L' (the part of each ancestor's genes that ends up in i)"""
+    row: dict[int, float] = defaultdict(float)
+    row[i] = 1.0
+    heap = [-i]
+    queued = {i}
+    out = {}
+    while heap:
+        j = -heapq.heappop(heap)
+        value = row.pop(j)
+        out[j] = value
+        for parent in (ped.father[j], ped.mother[j]):
+            if parent >= 0:
+                parent = int(parent)
+                row[parent] += 0.5 * value
+                if parent not in queued:
+                    queued.add(parent)
+                    heapq.heappush(heap, -parent)
+    return out
+
+
+@profiled()
+def _meuwissen_luo(ped: Pedigree) -> tuple[np.ndarray, np.ndarray]:
+    """everyone's inbreeding coefficient and the D of A = L D L'"""
+    n = len(ped)
+    inbred = np.zeros(n)
+    d = np.zeros(n)
+    # full siblings come out the same so each couple is only worked out once
+    couples: dict[tuple[int, int], float] = {}
+    for i in range(n):
+        f, m = int(ped.father[i]), int(ped.mother[i])
+        ff = inbred[f] if f >= 0 else -1.0
+        fm = inbred[m] if m >= 0 else -1.0
+        d[i] = 0.5 - 0.25 * (ff + fm)
+        if f < 0 or m < 0:
+            continue
+        if (f, m) not in couples:
+            row = _lrow(ped, i)
+            couples[f, m] = sum(value * value * d[j] for j, value in row.items()) - 1
+        inbred[i] = couples[f, m]
+    return inbred, d
+
+
+@profiled()
+def inbreeding(ped: Pedigree) -> dict[Any, float]:
+    """the inbreeding coefficient of everyone in the pedigree"""
+    inbred, _ = _meuwissen_luo(ped)
+    return dict(zip(ped.ids, inbred.tolist()))
+
+
+@profiled()
+def kinship(ped: Pedigree, pairs: Iterable[tuple[Any, Any]]) -> dict[tuple[Any, Any], float]:
+    """the kinship of each pair of ids
+
+    only the people in the pairs and their ancestors are looked at. that's done
+    as a matrix unless there are more than dense_limit of them
+    """
+    pairs = list(pairs)
+    people = {person_id for pair in pairs for person_id in pair}
+    indexes = ped.ancestors(ped.index[person_id] for person_id in people)
+
+    if len(indexes) <= dense_limit:
+        matrix = kinship_matrix(ped, indexes)
+        where = {int(i): n for n, i in enumerate(indexes)}
+        return {
+            (a, b): float(matrix[where[ped.index[a]], where[ped.index[b]]])
+            for a, b in pairs
+        }
+
+    # too many for a matrix, kinship is half of sum(L[a, j] L[b, j] D[j])
+    _, d = _meuwissen_luo(ped)
+    rows: dict[Any, dict[int, float]] = {}
+    for person_id in people:
+        rows[person_id] = _lrow(ped, ped.index[person_id])
+    out = {}
+    for a, b in pairs:
+        row_a, row_b = rows[a], rows[b]
+        if len(row_b) < len(row_a):
+            row_a, row_b = row_b, row_a
+        out[(a, b)] = 0.5 * sum(value * row_b[j] * d[j] for j, value in row_a.items() if j in row_b)
+    return out
+
+
+def for_people(tree: Tree, people: Iterable[Person]) -> Pedigree:
+    """a pedigree of just some people and their ancestors, so a big tree doesn't need loading in full"""
+    found: set[Person] = set()
+    for person in people:
+        found.add(person)
+        found.update(tree.ancestors(person))
+    return Pedigree(found)
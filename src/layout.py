@@ -0,0 +1,308 @@
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from .family_tree import Tree, Person, Sex
+from .profiling import profiled
+
+
+row_spacing = 300
+column_spacing = 500
+
+
+@dataclass
+class Layout:
+    """Where everyone within some number of levels of a head person goes"""
+    head: Person
+    levels: int
+    people: set[Person] = field(default_factory=set)
+    generation: dict[Any, int] = field(default_factory=dict)
+    positions: dict[Any, tuple[float, float]] = field(default_factory=dict)
+
+    @property
+    def rows(self) -> dict[int, list[Person]]:
+        rows: dict[int, list[Person]] = defaultdict(list)
+        for person in self.people:
+            rows[self.generation[person.id]].append(person)
+        return rows
+
+
+class LayoutCache:
+    """The last few heads' layouts so going back to someone doesn't lay them out again
+
+    only the deepest layout for each head is kept
+    """
+    def __init__(self, size: int=8):
+        self.size = size
+        self.layouts: OrderedDict[Any, Layout] = OrderedDict()
+
+    def get(self, head_id: Any) -> Optional[Layout]:
+        result = self.layouts.get(head_id)
+        if result is not None:
+            self.layouts.move_to_end(head_id)
+        return result
+
+    def put(self, result: Layout):
+        old = self.layouts.get(result.head.id)
+        if old is None or old.levels is not None and (result.levels is None or result.levels >= old.levels):
+            self.layouts[result.head.id] = result
+        self.layouts.move_to_end(result.head.id)
+        while len(self.layouts) > self.size:
+            self.layouts.popitem(last=False)
+
+    def clear(self):
+        self.layouts.clear()
+
+
+@profiled()
+def generations(tree: Tree, head: Person, people: set[Person]) -> dict[Any, int]:
+    """the generation of everyone in people relative to head
+
+    same numbers as Tree.generation but with one search for everyone
+    """
+    found: dict[Any, int] = {head.id: 0}
+    level = [head]
+    remaining = len(people - {head})
+
+    while level and remaining:
+        next_level = []
+        for person in level:
+            gen = found[person.id]
+            for fam in person.parents + person.children:
+                if fam.person_id in found:
+                    continue
+                found[fam.person_id] = gen + 1 if fam.relation.is_parent() else gen - 1
+                next_level.append(fam.person)
+                if fam.person in people:
+                    remaining -= 1
+        level = next_level
+
+    return {person.id: found[person.id] for person in people if person.id in found}
+
+
+def _centred(row: list[Person]) -> dict[Any, float]:
+    """where everyone in a row is from -0.5 to 0.5, so rows of different lengths line up in the middle"""
+    count = len(row)
+    return {person.id: (i + 0.5) / count - 0.5 for i, person in enumerate(row)}
+
+
+def _couples(row: list[Person], place: dict[Any, float]) -> list[list[Person]]:
+    """split a row into people that have to stay next to each other (spouses)
+
+    each block keeps the order of the row, except a couple goes husband first
+    """
+    by_id = {person.id: person for person in row}
+    seen: set[Any] = set()
+    blocks = []
+    for person in row:
+        if person.id in seen:
+            continue
+        seen.add(person.id)
+        block = []
+        todo = [person]
+        while todo:
+            current = todo.pop()
+            block.append(current)
+            for fam in current.spouses:
+                if fam.person_id in by_id and fam.person_id not in seen:
+                    seen.add(fam.person_id)
+                    todo.append(by_id[fam.person_id])
+        if len(block) == 2:
+            block.sort(key=lambda p: (p.sex != Sex.male, place[p.id]))
+        elif len(block) > 2:
+            block = _chain(block, by_id, place)
+        blocks.append(block)
+    return blocks
+
+
+def _chain(block: list[Person], by_id: dict[Any, Person], place: dict[Any, float]) -> list[Person]:
+    """someone with more than one spouse, put them in a line so each couple is side by side where possible"""
+    ids = {person.id for person in block}
+
+    def spouses(person: Person) -> list[Person]:
+        return sorted(
+            (by_id[fam.person_id] for fam in person.spouses if fam.person_id in ids),
+            key=lambda p: place[p.id],
+        )
+
+    # start from an end of the line (the fewest spouses), leftmost first
+    start = min(block, key=lambda p: (len(spouses(p)), place[p.id]))
+    chain = [start]
+    done = {start.id}
+    current = start
+    while True:
+        following = [p for p in spouses(current) if p.id not in done]
+        if not following:
+            break
+        current = following[0]
+        chain.append(current)
+        done.add(current.id)
+    # anyone the line couldn't reach (more than two spouses) goes on the end
+    chain.extend(sorted((p for p in block if p.id not in done), key=lambda p: place[p.id]))
+    return chain
+
+
+def _crossings(upper: dict[Any, float], lower: list[Person]) -> int:
+    """how many parent lines between two rows cross, counted as inversions with a fenwick tree
+
+    like the viewer each child has one line, to halfway between their parents
+    """
+    edges = []
+    for i, person in enumerate(lower):
+        xs = [upper[fam.person_id] for fam in person.parents if fam.person_id in upper]
+        if xs:
+            edges.append((sum(xs) / len(xs), i))
+    edges.sort()
+    tree = [0] * (len(lower) + 1)
+    count = 0
+    for seen, (_, i) in enumerate(edges):
+        # everything already added that's to the right of i crosses this line
+        j = i + 1
+        before = 0
+        while j:
+            before += tree[j]
+            j -= j & -j
+        count += seen - before
+        j = i + 1
+        while j <= len(lower):
+            tree[j] += 1
+            j += j & -j
+    return count
+
+
+def _total_crossings(rows: dict[int, list[Person]]) -> int:
+    return sum(
+        _crossings(_centred(rows[generation + 1]), rows[generation])
+        for generation in rows
+        if generation + 1 in rows
+    )
+
+
+def _reorder(row: list[Person], fixed: dict[Any, float], up: bool) -> list[Person]:
+    """sort a row by where the people they're joined to in the fixed row are (the barycentre)"""
+    place = _centred(row)
+    blocks = _couples(row, place)
+    centres: dict[Any, float] = {}
+    for block in blocks:
+        xs = [
+            fixed[fam.person_id]
+            for person in block
+            for fam in (person.parents if up else person.children)
+            if fam.person_id in fixed
+        ]
+        if xs:
+            for person in block:
+                centres[person.id] = sum(xs) / len(xs)
+
+    keyed = []
+    for block in blocks:
+        here = sum(place[person.id] for person in block) / len(block)
+        centre = centres.get(block[0].id)
+        if centre is None:
+            # nothing in the fixed row, so go with their brothers and sisters
+            # if any of them have somewhere to be, otherwise stay about where they are
+            xs = [
+                centres[sibling.person_id]
+                for person in block
+                for sibling in person.siblings
+                if sibling.person_id in centres
+            ]
+            centre = sum(xs) / len(xs) if xs else here
+        keyed.append((centre, here, block))
+    keyed.sort(key=lambda k: (k[0], k[1]))
+    return [person for _, _, block in keyed for person in block]
+
+
+@profiled()
+def order_rows(rows: dict[int, list[Person]], sweeps: int=4) -> dict[int, list[Person]]:
+    """order each generation's row so few parent lines cross and couples sit together
+
+    sweeps down and back up the rows moving everyone to the average position of
+    their parents (or children), keeping whichever ordering crosses least.
+    the same rows always give the same order
+    """
+    order = {
+        generation: sorted(row, key=lambda p: (str(p.dob or ''), p.name, str(p.id)))
+        for generation, row in rows.items()
+    }
+    # start with couples together
+    for generation, row in order.items():
+        order[generation] = [person for block in _couples(row, _centred(row)) for person in block]
+
+    best = dict(order)
+    best_crossings = _total_crossings(order)
+    top_down = sorted(order, reverse=True)
+    for sweep in range(sweeps):
+        if not best_crossings:
+            break
+        # ancestors are the higher generations, down means towards descendants
+        up = sweep % 2 == 0
+        sweep_order = top_down if up else top_down[::-1]
+        for previous, generation in zip(sweep_order, sweep_order[1:]):
+            order[generation] = _reorder(order[generation], _centred(order[previous]), up)
+        crossings = _total_crossings(order)
+        if crossings < best_crossings:
+            best = dict(order)
+            best_crossings = crossings
+    return best
+
+
+def _place_row(row: list[Person], generation: int, fixed: dict[Any, tuple[float, float]]) -> dict[Any, tuple[float, float]]:
+    """where everyone in an ordered row goes, anyone in fixed stays where they are
+
+    everyone else goes a column along from whoever is before them in the row
+    (or after them, for the people before the first fixed one), past anyone
+    that's already there
+    """
+    y = -generation * row_spacing
+    count = len(row)
+    anchors = [i for i, person in enumerate(row) if person.id in fixed]
+    if not anchors:
+        return {person.id: ((i - count/2) * column_spacing, y) for i, person in enumerate(row)}
+
+    taken = [fixed[person.id][0] for person in row if person.id in fixed]
+    positions: dict[Any, tuple[float, float]] = {}
+
+    def place(person: Person, x: float, step: int):
+        while True:
+            close = [t for t in taken if abs(t - x) < column_spacing]
+            if not close:
+                break
+            x = (max(close) if step > 0 else min(close)) + step * column_spacing
+        taken.append(x)
+        positions[person.id] = (x, y)
+
+    x = fixed[row[anchors[0]].id][0]
+    for person in reversed(row[:anchors[0]]):
+        place(person, x - column_spacing, -1)
+        x = positions[person.id][0]
+    for person in row[anchors[0]:]:
+        if person.id in fixed:
+            positions[person.id] = fixed[person.id]
+            x = fixed[person.id][0]
+        else:
+            place(person, x + column_spacing, 1)
+            x = positions[person.id][0]
+    return positions
+
+
+@profiled()
+def layout(
+    tree: Tree,
+    head: Optional[Person]=None,
+    levels: Optional[int]=None,
+    fixed: Optional[dict[Any, tuple[float, float]]]=None,
+) -> Layout:
+    """explore around head and put each generation in its own row
+
+    fixed is where people already are (e.g. on screen), they stay there and
+    anyone new is fitted in around them in the order a fresh layout would use
+    """
+    head = head or tree.head
+    result = Layout(head, levels)
+    result.people = tree.explore(head, levels)
+    result.generation = generations(tree, head, result.people)
+
+    for generation, row in order_rows(result.rows).items():
+        result.positions.update(_place_row(row, generation, fixed or {}))
+
+    return result
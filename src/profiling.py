@@ -0,0 +1,92 @@
+"""Opt in call counts and timings for the tree and the viewer
+
+turn it on for a whole run with FAMILY_TREE_PROFILE=1 (the summary is printed
+when python exits) or for part of one with
+
+    with profiling.profile():
+        tree = Tree(people)
+
+when it's off a profiled function only costs one extra call and a flag check
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, DefaultDict, Optional, TextIO
+import atexit
+import os
+import sys
+import time
+
+
+enabled = bool(os.environ.get('FAMILY_TREE_PROFILE'))
+calls: DefaultDict[str, int] = defaultdict(int)
+seconds: DefaultDict[str, float] = defaultdict(float)
+# how deep each name is in its own recursion, only the outermost call is timed
+_depth: DefaultDict[str, int] = defaultdict(int)
+
+
+def count(name: str, n: int=1):
+    """bump a counter that isn't tied to a function"""
+    if enabled:
+        calls[name] += n
+
+
+def profiled(name: Optional[str]=None) -> Callable:
+    """count calls to a function and how long they take"""
+    def decorator(func: Callable) -> Callable:
+        label = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            calls[label] += 1
+            if _depth[label]:
+                return func(*args, **kwargs)
+            _depth[label] += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds[label] += time.perf_counter() - start
+                _depth[label] -= 1
+        return wrapper
+    return decorator
+
+
+def reset():
+    calls.clear()
+    seconds.clear()
+
+
+def summary(file: TextIO=sys.stderr):
+    """print a table of everything that was counted, slowest first"""
+    if not calls:
+        return
+    names = sorted(calls, key=lambda name: (-seconds.get(name, 0), name))
+    width = max(len(name) for name in names)
+    print(f'{"":<{width}} {"calls":>10} {"total s":>10} {"per call ms":>12}', file=file)
+    for name in names:
+        total = seconds.get(name)
+        if total is None:
+            print(f'{name:<{width}} {calls[name]:>10}', file=file)
+        else:
+            print(f'{name:<{width}} {calls[name]:>10} {total:>10.4f} {1000*total/calls[name]:>12.4f}', file=file)
+
+
+@contextmanager
+def profile(file: TextIO=sys.stderr):
+    """profile everything inside the with block and print a summary after"""
+    global enabled
+    was_enabled = enabled
+    enabled = True
+    reset()
+    try:
+        yield
+    finally:
+        enabled = was_enabled
+        summary(file)
+
+
+if enabled:
+    atexit.register(summary)
@@ -0,0 +1,322 @@
+"""Split a big tree into one file per family branch and only load the ones in use
+
+    write_shards(tree, 'shards/', head_id='Joshua Thomas Andrews')
+    tree = ShardedTree('shards/manifest.json')
+    tree.explore(tree.head, 3)   # only reads the shards it walks into
+
+    python -m src.shards data/example1.csv shards/ "Joshua Thomas Andrews"
+
+each grandparent of the head (or whoever is `levels` up) starts a shard with
+all their ancestors, the shards then grow out from there in turn up to 1.5
+times the average size and people are moved between shards while that cuts
+relations between them.
+shard files are the usual csv but with every relation written (children and
+siblings too), so a shard never needs another one to know who's related to who. the manifest
+has which shard everyone is in and every relation that crosses shards
+"""
+from collections import Counter, defaultdict, deque
+from math import ceil
+from typing import Any, Iterable, Iterator, Optional
+import json
+import os
+import sys
+import threading
+from .diff import normalise_edge
+from .family_tree import LazyFamily, Person, Tree, csv_columns, read_csv
+from .profiling import profiled
+
+
+def _graph(people: Iterable[Person]) -> tuple[dict[Any, set[Any]], dict[Any, list[Any]]]:
+    """who everyone is joined to (parents, children and spouses) and who their parents are"""
+    graph: dict[Any, set[Any]] = defaultdict(set)
+    parents: dict[Any, list[Any]] = defaultdict(list)
+    for person in people:
+        graph[person.id]
+        for fam in person.family:
+            if fam.relation.is_parent():
+                parents[person.id].append(fam.person_id)
+            if fam.relation.is_parent() or fam.relation.is_child() or fam.relation.is_spouse():
+                graph[person.id].add(fam.person_id)
+                graph[fam.person_id].add(person.id)
+    return graph, parents
+
+
+def _up(parents: dict[Any, list[Any]], start: Iterable[Any], levels: Optional[int]=None) -> list[set[Any]]:
+    """each generation above start, levels of them (or all)"""
+    out = []
+    level = set(start)
+    while level and levels != 0:
+        level = {parent for person_id in level for parent in parents.get(person_id, ())}
+        if level:
+            out.append(level)
+        levels = levels - 1 if levels else levels
+    return out
+
+
+@profiled()
+def partition(
+    graph: dict[Any, set[Any]],
+    claims: list[set[Any]],
+    passes: int=10,
+    balance: float=1.5,
+) -> dict[Any, int]:
+    """which shard everyone goes in, starting from the people each shard claims
+
+    the shards grow out from their claims in turn, one person's relations at a
+    time, and stop at balance times the average size. a shard that runs out of
+    people next to it carries on from someone nobody has reached yet, so people
+    in other branches (or not joined to anyone) fill up whichever shards have
+    room. then anyone with more relations in another shard is moved there as
+    long as that keeps every shard between average / balance and average * balance,
+    and any shard still outside that gets people from its edge moved in or out
+    """
+    k = max(1, len(claims))
+    average = len(graph) / k
+    cap = max(ceil(average), ceil(balance * average))
+    floor = int(average / balance)
+    owner: dict[Any, int] = {}
+    sizes = [0] * k
+    queues: list[deque] = [deque() for _ in range(k)]
+
+    def take(person_id, shard):
+        owner[person_id] = shard
+        sizes[shard] += 1
+        queues[shard].append(person_id)
+
+    for shard, claim in enumerate(claims):
+        for person_id in sorted(claim, key=str):
+            if person_id in graph and person_id not in owner and sizes[shard] < cap:
+                take(person_id, shard)
+
+    order = sorted(graph, key=str)
+    # everyone before this in order has a shard
+    unowned = 0
+    while len(owner) < len(graph):
+        for shard in range(k):
+            if len(owner) == len(graph):
+                break
+            if sizes[shard] >= cap:
+                continue
+            if not queues[shard]:
+                while order[unowned] in owner:
+                    unowned += 1
+                take(order[unowned], shard)
+                continue
+            person_id = queues[shard].popleft()
+            for other in sorted(graph[person_id], key=str):
+                if sizes[shard] >= cap:
+                    break
+                if other not in owner:
+                    take(other, shard)
+
+    for _ in range(passes):
+        moved = 0
+        for person_id in order:
+            here = owner[person_id]
+            counts = Counter(owner[other] for other in graph[person_id])
+            if not counts:
+                continue
+            best = max(counts, key=lambda s: (counts[s], s == here, -s))
+            if best != here and counts[best] > counts[here] and sizes[best] < cap and sizes[here] > floor:
+                owner[person_id] = best
+                sizes[here] -= 1
+                sizes[best] += 1
+                moved += 1
+        if not moved:
+            break
+
+    _rebalance(graph, owner, sizes, order, cap, min(floor, len(graph) // k))
+    return owner
+
+
+def _rebalance(graph: dict[Any, set[Any]], owner: dict[Any, int], sizes: list[int], order: list[Any], cap: int, floor: int):
+    """move people out of the biggest shard into the smallest until every shard is between floor and cap
+
+    growing can leave a shard short when its neighbours got to everyone first,
+    so whoever in the biggest shard has the most relations in the smallest (and
+    the fewest in their own) goes, which keeps as many relations together as it can
+    """
+    while max(sizes) > cap or min(sizes) < floor:
+        small = min(range(len(sizes)), key=lambda s: (sizes[s], s))
+        big = max(range(len(sizes)), key=lambda s: (sizes[s], -s))
+        if sizes[big] - sizes[small] < 2:
+            break
+
+        def score(person_id):
+            return sum((owner[other] == small) - (owner[other] == big) for other in graph[person_id])
+        person_id = max((p for p in order if owner[p] == big), key=score)
+        owner[person_id] = small
+        sizes[big] -= 1
+        sizes[small] += 1
+
+
+def branches(people: Iterable[Person], head_id: Any, levels: int=2) -> list[set[Any]]:
+    """a claim for each of head's ancestors `levels` up (grandparents by default) and all of their ancestors
+
+    if the tree doesn't go up that far the furthest generation there is gets used
+    """
+    _, parents = _graph(people)
+    generations = _up(parents, [head_id], levels)
+    if not generations:
+        return [{head_id}]
+    claims = []
+    for seed in sorted(generations[-1], key=str):
+        claim = {seed}
+        for level in _up(parents, [seed]):
+            claim |= level
+        claims.append(claim)
+    return claims
+
+
+def cut(graph: dict[Any, set[Any]], owner: dict[Any, int]) -> int:
+    """how many relations go between shards"""
+    return sum(owner[a] != owner[b] for a in graph for b in graph[a]) // 2
+
+
+@profiled()
+def write_shards(people: Iterable[Person], out_dir, head_id: Any, levels: int=2) -> dict:
+    """split people (connected, e.g. a Tree) into shard csvs and a manifest.json in out_dir"""
+    people = list(people)
+    graph, _ = _graph(people)
+    owner = partition(graph, branches(people, head_id, levels))
+    by_id = {person.id: person for person in people}
+    shards: dict[int, list[Person]] = defaultdict(list)
+    for person_id, shard in owner.items():
+        if person_id in by_id:
+            shards[shard].append(by_id[person_id])
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest: dict[str, Any] = {'head': head_id, 'shards': {}, 'owner': {}, 'cross': []}
+    for shard, members in sorted(shards.items()):
+        name = f'shard-{shard}.csv'
+        with open(os.path.join(out_dir, name), 'w', newline='') as f:
+            f.write(','.join(csv_columns) + '\n')
+            for person in sorted(members, key=lambda p: str(p.id)):
+                f.write(person.save_str2(all_relations=True) + '\n')
+        manifest['shards'][str(shard)] = {'file': name, 'people': len(members)}
+
+    manifest['owner'] = {str(person_id): owner[person_id] for person_id in by_id}
+    cross = set()
+    for person in people:
+        for fam in person.family:
+            if fam.person_id in owner and owner[fam.person_id] != owner[person.id]:
+                key = normalise_edge(str(person.id), fam.relation, str(fam.person_id))
+                if key is not None:
+                    cross.add(key)
+    manifest['cross'] = [list(key) for key in sorted(cross)]
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+class ReadOnlyShards(Exception):
+    """A ShardedTree was asked to change someone, shards are only for reading
+
+    change the full tree and write the shards again instead
+    """
+    def __init__(self, method: str):
+        super().__init__(f'ShardedTree.{method}: shards are read only, change the full tree and shard it again')
+
+
+class ShardedTree(Tree):
+    """A tree split up by write_shards that loads a shard the first time someone in it is needed
+
+    everyone's relations are lazy so walking the tree (explore, explore_up,
+    explore_down, path...) pulls in the next shard only when it steps into it.
+    anything that needs everyone (iterating, search_names) loads every shard
+    """
+    def __init__(self, manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.dir = os.path.dirname(manifest_path)
+        self.shards: dict[int, str] = {int(k): v['file'] for k, v in manifest['shards'].items()}
+        self.owner: dict[Any, int] = manifest['owner']
+        self.cross = [tuple(key) for key in manifest['cross']]
+        self.people: dict[Any, Person] = {}
+        self.loaded: set[int] = set()
+        # the viewer explores from a worker thread
+        self.lock = threading.RLock()
+        self._head = None
+        self.head_id = manifest['head']
+
+    @profiled('ShardedTree.load_shard')
+    def load_shard(self, shard: int):
+        with self.lock:
+            if shard in self.loaded:
+                return
+            self.loaded.add(shard)
+            for person in read_csv(os.path.join(self.dir, self.shards[shard])):
+                person.family = [LazyFamily(self, fam.relation, fam.person_id, fam.notes) for fam in person.family]
+                self.people[person.id] = person
+
+    def load_all(self):
+        for shard in self.shards:
+            self.load_shard(shard)
+
+    @property
+    def tree(self) -> set[Person]:
+        self.load_all()
+        return set(self.people.values())
+
+    def __iter__(self) -> Iterator[Person]:
+        self.load_all()
+        return iter(list(self.people.values()))
+
+    def __len__(self):
+        return len(self.owner)
+
+    def __contains__(self, other: Person) -> bool:
+        return other.id in self.owner
+
+    def __str__(self) -> str:
+        return f'ShardedTree({len(self.loaded)}/{len(self.shards)} shards loaded)'
+
+    @property
+    def head(self) -> Person:
+        if self._head is None:
+            self._head = self.get(self.head_id)
+        return self._head
+
+    @profiled('ShardedTree.get')
+    def get(self, id: Any) -> Optional[Person]:
+        person = self.people.get(id)
+        if person is None and id in self.owner:
+            self.load_shard(self.owner[id])
+            person = self.people.get(id)
+        return person
+
+    def search_names(self, name: str) -> set[Person]:
+        """Get a list of people who have a partial match to a name"""
+        self.load_all()
+        return {person for person in self.people.values() if name in person.name}
+
+    def connect(self):
+        # shard files already have every relation both ways
+        pass
+
+    def fix(self):
+        pass
+
+    # everything on Tree that changes people
+    def add(self, node: Person) -> None:
+        raise ReadOnlyShards('add')
+
+    def rename(self, old: Any, new: Any):
+        raise ReadOnlyShards('rename')
+
+    def re_id(self, name: str):
+        raise ReadOnlyShards('re_id')
+
+    def update(self, other: Tree, this_id: Any, other_id: Any):
+        raise ReadOnlyShards('update')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print('usage: python -m src.shards <csv> <out dir> <head id>', file=sys.stderr)
+        sys.exit(1)
+    tree = Tree(read_csv(sys.argv[1]))
+    manifest = write_shards(tree, sys.argv[2], sys.argv[3])
+    sizes = ', '.join(str(shard['people']) for shard in manifest['shards'].values())
+    print(f'{len(manifest["shards"])} shards ({sizes}), {len(manifest["cross"])} relations between them')
@@ -0,0 +1,270 @@
+"""A family tree kept in a sqlite file
+
+people are only turned into Person objects when something asks for them
+(explore, get, path...) and only the most recently used ones are kept around
+
+    python -m src.sqlite_tree data/example1.csv family.db
+"""
+from collections import OrderedDict
+from typing import Any, Iterator, Optional
+import csv
+import sqlite3
+import sys
+import threading
+from .family_tree import LazyFamily, Person, Relation, Sex, Tree
+from .profiling import profiled
+
+
+schema = '''
+CREATE TABLE IF NOT EXISTS people (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    dob TEXT,
+    dod TEXT,
+    sex TEXT,
+    child_complete TEXT,
+    spouse_complete TEXT,
+    sources TEXT,
+    notes TEXT
+);
+CREATE INDEX IF NOT EXISTS people_name ON people(name);
+CREATE TABLE IF NOT EXISTS edges (
+    person_id TEXT NOT NULL,
+    relation TEXT NOT NULL,
+    other_id TEXT NOT NULL,
+    notes TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (person_id, other_id, relation)
+);
+CREATE INDEX IF NOT EXISTS edges_other ON edges(other_id);
+'''
+
+parent_relations = "('parent', 'father', 'mother', 'adopted_parent')"
+spouse_relations = "('spouse', 'partner')"
+
+# the same rules as Tree.connect: relation -> what the other person gets back,
+# unless they already have some relation to us
+reverse_relations = {
+    'parent': 'child',
+    'father': 'child',
+    'mother': 'child',
+    'child': 'parent',
+    'adopted_parent': 'adopted_child',
+    'adopted_child': 'adopted_parent',
+}
+
+
+def connect(conn: sqlite3.Connection):
+    """make every relation go both ways and add siblings, like Tree.connect and Tree.fix"""
+    with conn:
+        for relation, reverse in reverse_relations.items():
+            conn.execute('''
+                INSERT OR IGNORE INTO edges (person_id, relation, other_id)
+                SELECT e.other_id, ?, e.person_id FROM edges e
+                WHERE e.relation = ? AND NOT EXISTS (
+                    SELECT 1 FROM edges r WHERE r.person_id = e.other_id AND r.other_id = e.person_id
+                )
+            ''', (reverse, relation))
+        conn.execute(f'''
+            INSERT OR IGNORE INTO edges (person_id, relation, other_id)
+            SELECT e.other_id, e.relation, e.person_id FROM edges e
+            WHERE e.relation IN {spouse_relations} AND NOT EXISTS (
+                SELECT 1 FROM edges r
+                WHERE r.person_id = e.other_id AND r.other_id = e.person_id
+                AND r.relation IN {spouse_relations}
+            )
+        ''')
+        conn.execute(f'''
+            INSERT OR IGNORE INTO edges (person_id, relation, other_id)
+            SELECT a.person_id, CASE WHEN COUNT(*) >= 2 THEN 'sibling' ELSE 'step_sibling' END, b.person_id
+            FROM edges a JOIN edges b ON a.other_id = b.other_id AND a.person_id != b.person_id
+            WHERE a.relation IN {parent_relations} AND b.relation IN {parent_relations}
+            GROUP BY a.person_id, b.person_id
+        ''')
+        for sex, relation in (('male', 'father'), ('female', 'mother')):
+            conn.execute('''
+                UPDATE edges SET relation = ?
+                WHERE relation = 'parent' AND other_id IN (SELECT id FROM people WHERE sex = ?)
+            ''', (relation, sex))
+
+
+def import_csv(csv_path, db_path, batch_size: int=1000) -> sqlite3.Connection:
+    """load one of our csv files into a sqlite file, batch_size rows per transaction"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(schema)
+
+    def flush(people, edges):
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO people VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', people)
+            conn.executemany('INSERT OR IGNORE INTO edges VALUES (?, ?, ?, ?)', edges)
+        people.clear()
+        edges.clear()
+
+    people: list[tuple] = []
+    edges: list[tuple] = []
+    with open(csv_path, newline='') as f:
+        for line in csv.DictReader(f):
+            person_id = line['id'] or line['name']
+            people.append((
+                person_id, line['name'], line['dob'], line['dod'], line['sex'] or Sex.unknown.name,
+                line['child complete'], line['spouse complete'], line['sources'], line['notes'],
+            ))
+            if line['family']:
+                for fam in line['family'].split(','):
+                    relation, other_id, *notes = fam.split(':')
+                    edges.append((person_id, relation, other_id, notes[0] if notes else ''))
+            if len(people) >= batch_size:
+                flush(people, edges)
+    flush(people, edges)
+
+    connect(conn)
+    return conn
+
+
+class SqliteTree(Tree):
+    """A family tree stored in sqlite that only loads people when they're reached
+
+    at most cache_size people are held in memory at once
+    """
+    def __init__(self, path, cache_size: int=10000):
+        self.db_path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(schema)
+        # the viewer explores from a worker thread
+        self.lock = threading.RLock()
+        self.cache: OrderedDict[Any, Person] = OrderedDict()
+        self.cache_size = cache_size
+        self._head = None
+
+    def __iter__(self) -> Iterator[Person]:
+        with self.lock:
+            ids = [row[0] for row in self.conn.execute('SELECT id FROM people')]
+        for person_id in ids:
+            yield self.get(person_id)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM people').fetchone()[0]
+
+    def __contains__(self, other: Person) -> bool:
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM people WHERE id = ?', (other.id,)).fetchone() is not None
+
+    def __str__(self) -> str:
+        return f'SqliteTree({self.db_path!r})'
+
+    @property
+    def head(self) -> Person:
+        if self._head is None:
+            with self.lock:
+                row = self.conn.execute('SELECT id FROM people LIMIT 1').fetchone()
+            if row is not None:
+                self._head = self.get(row[0])
+        return self._head
+
+    @profiled('SqliteTree.get')
+    def get(self, id: Any) -> Person:
+        with self.lock:
+            person = self.cache.get(id)
+            if person is not None:
+                self.cache.move_to_end(id)
+                return person
+            return self._load(id)
+
+    @profiled('SqliteTree.load')
+    def _load(self, id: Any) -> Optional[Person]:
+        row = self.conn.execute(
+            'SELECT name, dob, dod, sex, child_complete, spouse_complete, sources, notes FROM people WHERE id = ?',
+            (id,),
+        ).fetchone()
+        if row is None:
+            return None
+        name, dob, dod, sex, child_complete, spouse_complete, sources, notes = row
+        family = [
+            LazyFamily(self, Relation[relation], other_id, other_notes)
+            for relation, other_id, other_notes in self.conn.execute(
+                'SELECT relation, other_id, notes FROM edges WHERE person_id = ? ORDER BY rowid', (id,)
+            )
+        ]
+        person = Person(
+            name=name,
+            dob=dob,
+            dod=dod,
+            sex=Sex[sex] if sex else Sex.unknown,
+            family=family,
+            child_complete=child_complete,
+            spouse_complete=spouse_complete,
+            sources=sources,
+            notes=notes,
+            id=id,
+        )
+        self.cache[id] = person
+        while len(self.cache) > self.cache_size:
+            self._evict()
+        return person
+
+    def _evict(self, id: Any=None):
+        if id is None:
+            id, _ = self.cache.popitem(last=False)
+        else:
+            self.cache.pop(id, None)
+        # it's fine for this person to be made again next time they're needed
+        Person.seen_ids.discard(id)
+
+    def search_names(self, name: str) -> set[Person]:
+        """Get a list of people who have a partial match to a name"""
+        with self.lock:
+            ids = [row[0] for row in self.conn.execute('SELECT id FROM people WHERE instr(name, ?) > 0', (name,))]
+        return {self.get(person_id) for person_id in ids}
+
+    def save(self, person: Person):
+        """write someone (and the relations they list) back to the file"""
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO people VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                person.id, person.name, person.dob, person.dod, person.sex.name if person.sex else None,
+                person.child_complete or '', person.spouse_complete or '',
+                ','.join(person.sources) if isinstance(person.sources, list) else person.sources,
+                person.notes,
+            ))
+            self.conn.execute('DELETE FROM edges WHERE person_id = ?', (person.id,))
+            self.conn.executemany('INSERT OR IGNORE INTO edges VALUES (?, ?, ?, ?)', [
+                (person.id, fam.relation.name, fam.person_id, fam.notes or '')
+                for fam in person.family
+            ])
+
+    def add(self, node: Person) -> None:
+        self.save(node)
+        self.connect()
+        with self.lock:
+            # reload them so their relations are lazy like everyone else's
+            self._evict(node.id)
+            for fam in node.family:
+                self._evict(fam.person_id)
+
+    def connect(self):
+        with self.lock:
+            connect(self.conn)
+
+    def fix(self):
+        # connect already sorts out mothers and fathers
+        pass
+
+    def rename(self, old: Any, new: Any):
+        if new is None:
+            new = self.get(old).name
+        with self.lock, self.conn:
+            assert self.conn.execute('SELECT 1 FROM people WHERE id = ?', (new,)).fetchone() is None
+            others = [row[0] for row in self.conn.execute('SELECT other_id FROM edges WHERE person_id = ?', (old,))]
+            self.conn.execute('UPDATE people SET id = ? WHERE id = ?', (new, old))
+            self.conn.execute('UPDATE edges SET person_id = ? WHERE person_id = ?', (new, old))
+            self.conn.execute('UPDATE edges SET other_id = ? WHERE other_id = ?', (new, old))
+            for person_id in [old] + others:
+                self._evict(person_id)
+        if self._head is not None and self._head.id == old:
+            self._head = self.get(new)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python -m src.sqlite_tree <csv> <db>', file=sys.stderr)
+        sys.exit(1)
+    import_csv(sys.argv[1], sys.argv[2]).close()
@@ -0,0 +1,201 @@
+"""Statistics about everyone's ancestors and descendants, all worked out in one go
+
+    table = subtree_stats(tree)
+    i = table['id'].index('Joshua Thomas Andrews')
+    table['ancestors'][i], table['ancestors_complete'][i]
+    per_generation(tree, tree.head)
+
+instead of an explore_down per person, everyone's descendants are built from
+their children's (and ancestors from their parents') in a single pass that
+visits each person once. the sets are bitsets, a python int with a bit for
+each person, so someone reached down two lines (pedigree collapse) is still
+only counted once. a bitset is dropped as soon as everyone that needs it has
+used it. sums over a set (lifespans) are counted a bit of the value at a time
+so nothing ever loops over the people in a set
+
+results are columnar, a dict of column name -> list with a row per person
+"""
+from collections import defaultdict
+from typing import Iterable, Optional
+from .family_tree import Person, Tree, year
+from .layout import generations
+from .profiling import profiled
+
+
+Table = dict[str, list]
+
+
+def lifespan(person: Person) -> Optional[int]:
+    """how many years someone lived, None unless both dates are known"""
+    born, died = year(person.dob), year(person.dod)
+    if born is None or died is None or died < born:
+        return None
+    return died - born
+
+
+def _order(people: list[Person]) -> tuple[list[int], list[list[int]], list[list[int]]]:
+    """people (as indexes) with parents before children, and everyone's parents and children"""
+    index = {person.id: i for i, person in enumerate(people)}
+    parents: list[list[int]] = [[] for _ in people]
+    children: list[list[int]] = [[] for _ in people]
+    for i, person in enumerate(people):
+        for fam in person.family:
+            j = index.get(fam.person_id)
+            if j is None:
+                continue
+            if fam.relation.is_parent() and j not in parents[i]:
+                parents[i].append(j)
+                if i not in children[j]:
+                    children[j].append(i)
+            elif fam.relation.is_child() and j not in children[i]:
+                children[i].append(j)
+                if i not in parents[j]:
+                    parents[j].append(i)
+
+    remaining = [len(p) for p in parents]
+    level = [i for i, count in enumerate(remaining) if count == 0]
+    order: list[int] = []
+    while level:
+        order.extend(level)
+        next_level = []
+        for i in level:
+            for child in children[i]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    next_level.append(child)
+        level = next_level
+    if len(order) != len(people):
+        stuck = sorted(str(people[i].id) for i, count in enumerate(remaining) if count)
+        raise ValueError(f'people are their own ancestors: {", ".join(stuck[:10])}')
+    return order, parents, children
+
+
+def _planes(values: list[Optional[int]]) -> tuple[int, list[int]]:
+    """a bitset of who has a value and one bitset per binary digit of the values"""
+    known = 0
+    planes: list[int] = []
+    for bit, value in enumerate(values):
+        if value is None:
+            continue
+        known |= 1 << bit
+        digit = 0
+        while value >> digit:
+            if digit == len(planes):
+                planes.append(0)
+            if value >> digit & 1:
+                planes[digit] |= 1 << bit
+            digit += 1
+    return known, planes
+
+
+def _total(members: int, planes: list[int]) -> int:
+    return sum((members & plane).bit_count() << digit for digit, plane in enumerate(planes))
+
+
+@profiled()
+def _sweep(
+    spans: list[Optional[int]],
+    complete: list[bool],
+    order: list[int],
+    inputs: list[list[int]],
+    users: list[list[int]],
+    kind: str,
+) -> Table:
+    """everyone's set built from the sets of their inputs (children for descendants, parents for ancestors)
+
+    people are given bits in the order they're visited so a set only ever
+    holds bits up to the person it belongs to
+    """
+    n = len(order)
+    bit = [0] * n
+    for position, i in enumerate(order):
+        bit[i] = position
+    lifespans, planes = _planes([spans[i] for i in order])
+    finished = 0
+    for position, i in enumerate(order):
+        if complete[i]:
+            finished |= 1 << position
+
+    count = [0] * n
+    depth = [0] * n
+    known = [0] * n
+    mean: list[Optional[float]] = [None] * n
+    done: list[Optional[float]] = [None] * n
+
+    sets: dict[int, int] = {}
+    waiting = [len(u) for u in users]
+    for i in order:
+        members = 0
+        for j in inputs[i]:
+            members |= sets[j] | 1 << bit[j]
+            depth[i] = max(depth[i], depth[j] + 1)
+            waiting[j] -= 1
+            if waiting[j] == 0:
+                # everyone that needs it has had it
+                del sets[j]
+        if waiting[i]:
+            sets[i] = members
+
+        count[i] = members.bit_count()
+        with_lifespan = members & lifespans
+        known[i] = with_lifespan.bit_count()
+        if known[i]:
+            mean[i] = _total(with_lifespan, planes) / known[i]
+        if count[i]:
+            done[i] = (members & finished).bit_count() / count[i]
+
+    return {
+        kind: count,
+        f'{kind}_generations': depth,
+        f'{kind}_known_lifespans': known,
+        f'{kind}_mean_lifespan': mean,
+        f'{kind}_complete': done,
+    }
+
+
+@profiled()
+def subtree_stats(people: Iterable[Person], descendants: bool=True, ancestors: bool=True) -> Table:
+    """for everyone: how many descendants and ancestors they have, how many
+    generations those go, their average lifespan and how many of them are complete
+
+    rows are sorted by id. someone with no descendants (or ancestors) has None
+    for the average and the complete fraction
+    """
+    people = sorted(people, key=lambda p: str(p.id))
+    order, parents, children = _order(people)
+    spans = [lifespan(person) for person in people]
+    complete = [bool(person.complete) for person in people]
+    table: Table = {
+        'id': [person.id for person in people],
+        'name': [person.name for person in people],
+    }
+    if descendants:
+        table.update(_sweep(spans, complete, order[::-1], children, parents, 'descendants'))
+    if ancestors:
+        table.update(_sweep(spans, complete, order, parents, children, 'ancestors'))
+    return table
+
+
+@profiled()
+def per_generation(tree: Tree, head: Optional[Person]=None) -> Table:
+    """how many people there are in each generation relative to head, with
+    their average lifespan and how many are complete. generations go up towards
+    ancestors, the same as Tree.generation
+    """
+    head = head or tree.head
+    found = generations(tree, head, set(tree))
+    rows: dict[int, list[Person]] = defaultdict(list)
+    for person in tree:
+        if person.id in found:
+            rows[found[person.id]].append(person)
+
+    table: Table = {'generation': [], 'people': [], 'known_lifespans': [], 'mean_lifespan': [], 'complete': []}
+    for generation in sorted(rows):
+        row = rows[generation]
+        spans = [span for span in map(lifespan, row) if span is not None]
+        table['generation'].append(generation)
+        table['people'].append(len(row))
+        table['known_lifespans'].append(len(spans))
+        table['mean_lifespan'].append(sum(spans) / len(spans) if spans else None)
+        table['complete'].append(sum(bool(person.complete) for person in row) / len(row))
+    return table
@@ -0,0 +1,201 @@
+"""Made up family trees for benchmarking
+
+everything comes from a seeded Random so the same arguments always give the
+same tree
+"""
+from math import ceil
+from random import Random
+from typing import Any, Optional
+import csv
+from .family_tree import Person, Sex, csv_columns, person_from_row
+
+
+given_names = {
+    Sex.male: [
+        'James', 'John', 'William', 'Thomas', 'George', 'Henry', 'Charles',
+        'Joseph', 'Samuel', 'Daniel', 'Jack', 'Lachlan', 'Joshua', 'Matthew',
+    ],
+    Sex.female: [
+        'Mary', 'Elizabeth', 'Sarah', 'Margaret', 'Ann', 'Jane', 'Emily',
+        'Alice', 'Catherine', 'Jessica', 'Chloe', 'Georgia', 'Isabella', 'Emma',
+    ],
+}
+surnames = [
+    'Smith', 'Andrews', 'Ryan', 'George', 'Brown', 'Taylor', 'Wilson',
+    'Walker', 'Wright', 'Thompson', 'White', 'Hughes', 'Edwards', 'Green',
+    'Hall', 'Wood', 'Harris', 'Lewis', 'Martin', 'Jackson', 'Clarke',
+]
+sources = ['', '', 'parish register', 'census', 'birth certificate', 'family bible']
+
+start_year = 1700
+generation_years = 28
+# chance that a child grows up and finds a spouse
+marriage_rate = 0.8
+
+
+def _line_size(generations: int, branching: float) -> float:
+    """roughly how many people one founding couple ends up with"""
+    couples = 1.0
+    total = 2.0
+    for _ in range(generations):
+        children = couples * branching
+        total += children * (1 + marriage_rate)
+        couples = children * marriage_rate
+    return total
+
+
+class _Generator:
+    def __init__(self, rng: Random, prefix: str, size: int):
+        self.rng = rng
+        self.prefix = prefix
+        self.size = size
+        self.rows: dict[Any, dict[str, str]] = {}
+        self.family: dict[Any, list[str]] = {}
+        self.sex: dict[Any, Sex] = {}
+        self.parents: dict[Any, tuple[Any, ...]] = {}
+        self.spouses: dict[Any, list[Any]] = {}
+
+    @property
+    def full(self):
+        return len(self.rows) >= self.size
+
+    def person(self, sex: Sex, generation: int, surname: Optional[str]=None, parents: tuple[Any, ...]=()) -> Any:
+        rng = self.rng
+        person_id = f'{self.prefix}{len(self.rows) + 1}'
+        surname = surname or rng.choice(surnames)
+        name = f'{rng.choice(given_names[sex])} {rng.choice(given_names[sex])} {surname}'
+
+        year = start_year + generation * generation_years + rng.randint(-5, 5)
+        dod = ''
+        if year < 1940:
+            dod = f'{year + rng.randint(1, 90)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}'
+
+        self.rows[person_id] = {
+            'name': name,
+            'dob': f'{year}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}',
+            'dod': dod,
+            'sex': sex.name,
+            'family': '',
+            'child complete': '',
+            'spouse complete': '',
+            'sources': rng.choice(sources),
+            'notes': '',
+            'id': person_id,
+        }
+        self.family[person_id] = [f'parent:{parent}' for parent in parents]
+        self.sex[person_id] = sex
+        self.parents[person_id] = parents
+        self.spouses[person_id] = []
+        return person_id
+
+    def marry(self, a: Any, b: Any):
+        self.family[a].append(f'spouse:{b}')
+        self.spouses[a].append(b)
+        self.spouses[b].append(a)
+
+    def children(self, father: Any, mother: Any, generation: int, branching: float) -> list[Any]:
+        surname = self.rows[father]['name'].rsplit(' ', 1)[-1]
+        kids = []
+        for _ in range(self.rng.randint(0, round(2 * branching))):
+            if self.full:
+                break
+            sex = self.rng.choice((Sex.male, Sex.female))
+            kids.append(self.person(sex, generation, surname, (father, mother)))
+        return kids
+
+    def spouse_for(self, person_id: Any, generation: int, pool: list[Any], collapse: float) -> Any:
+        """someone for person_id to marry, a relative in the tree if we can find one"""
+        sex = Sex.female if self.sex[person_id] == Sex.male else Sex.male
+        if self.rng.random() < collapse:
+            for _ in range(10):
+                other = self.rng.choice(pool)
+                if self.sex[other] != sex or self.spouses[other] or other == person_id:
+                    continue
+                if set(self.parents[other]) & set(self.parents[person_id]):
+                    continue
+                return other
+        return self.person(sex, generation)
+
+    def couple(self, a: Any, b: Any):
+        if self.sex[a] == Sex.male:
+            return a, b
+        return b, a
+
+
+def generate_rows(
+    size: int=1000,
+    generations: int=6,
+    branching: float=2.5,
+    remarriage: float=0.1,
+    collapse: float=0.05,
+    seed: int=0,
+    prefix: str='p',
+) -> list[dict[str, str]]:
+    """rows in the same shape as our csv files
+
+    size is how many people there are, new founding couples are added if the
+    first ones don't have enough descendants
+    branching is the average children per couple
+    remarriage is the chance someone with a spouse has children with a second one
+    collapse is the chance someone marries another person already in the tree
+    (pedigree collapse) instead of someone new
+    """
+    rng = Random(seed)
+    gen = _Generator(rng, prefix, size)
+
+    # keep starting new families until there are enough people, in case
+    # some die out early
+    while not gen.full:
+        _grow(gen, generations, branching, remarriage, collapse)
+
+    for person_id, row in gen.rows.items():
+        row['family'] = ','.join(gen.family[person_id])
+    return list(gen.rows.values())
+
+
+def _grow(gen: _Generator, generations: int, branching: float, remarriage: float, collapse: float):
+    """start some founding couples and fill in their descendants"""
+    rng = gen.rng
+    founders = max(1, ceil((gen.size - len(gen.rows)) / _line_size(generations, branching)))
+    couples = []
+    for _ in range(founders):
+        father = gen.person(Sex.male, 0)
+        mother = gen.person(Sex.female, 0)
+        gen.marry(father, mother)
+        couples.append((father, mother))
+
+    for generation in range(1, generations + 1):
+        children = []
+        for father, mother in couples:
+            children += gen.children(father, mother, generation, branching)
+            if gen.full:
+                break
+            if rng.random() < remarriage:
+                other = gen.person(Sex.female, generation - 1)
+                gen.marry(father, other)
+                children += gen.children(father, other, generation, branching)
+
+        couples = []
+        for child in children:
+            if gen.full:
+                break
+            if gen.spouses[child] or rng.random() > marriage_rate:
+                continue
+            spouse = gen.spouse_for(child, generation, children, collapse)
+            gen.marry(child, spouse)
+            couples.append(gen.couple(child, spouse))
+
+        if gen.full or not couples:
+            break
+
+
+def generate(*args, **kwargs) -> list[Person]:
+    """a made up tree, takes the same arguments as generate_rows"""
+    return [person_from_row(row) for row in generate_rows(*args, **kwargs)]
+
+
+def write_rows(path, rows: list[dict[str, str]]):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, csv_columns)
+        writer.writeheader()
+        writer.writerows(rows)
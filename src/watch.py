@@ -0,0 +1,243 @@
+"""Notice when a csv changes on disk and apply just the changed rows to a tree
+
+the files are polled on a thread which rereads and hashes them (see diff.py)
+whenever their size or modified time changes, so the viewer only ever gets
+handed the difference and never has to parse anything itself
+
+    watcher = Watcher(['data/example1.csv'])
+    ...
+    change = watcher.poll()
+    if change is not None:
+        apply(tree, change)
+
+edits made through a journal end up in the csv when it's compacted, applying
+those again is fine as every change here checks whether it's already been made
+"""
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+import csv
+import os
+import queue
+import threading
+import traceback
+from .diff import EdgeKey, Snapshot, TreeDiff, diff, fields, snapshot_rows
+from .family_tree import Family, Person, Relation, Sex, Tree, person_from_row, relink_siblings, siblings
+from .profiling import profiled
+
+
+# diff field -> Person attribute
+attributes = {
+    'name': 'name',
+    'dob': 'dob',
+    'dod': 'dod',
+    'sex': 'sex',
+    'child complete': 'child_complete',
+    'spouse complete': 'spouse_complete',
+    'sources': 'sources',
+    'notes': 'notes',
+}
+
+
+@dataclass
+class Change:
+    """What changed in one file, and the file as it is now"""
+    path: str
+    diff: TreeDiff
+    snapshot: Snapshot
+
+    @property
+    def structural(self) -> bool:
+        """whether people or relations changed, rather than just what's written on people"""
+        return bool(
+            self.diff.added or self.diff.removed
+            or self.diff.relations_added or self.diff.relations_removed
+            or any('sex' in changed for changed in self.diff.modified.values())
+        )
+
+
+class Watcher:
+    """Polls some csv files every interval seconds and queues up what changed in them"""
+    def __init__(self, paths: Iterable, interval: float=1.0):
+        self.paths = [str(path) for path in paths]
+        self.interval = interval
+        self.snapshots: dict[str, Snapshot] = {}
+        self.stamps: dict[str, tuple[int, int]] = {}
+        self.changes: queue.Queue[Change] = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def poll(self) -> Optional[Change]:
+        try:
+            return self.changes.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _run(self):
+        for path in self.paths:
+            self._read(path)
+        while not self.stopped.wait(self.interval):
+            for path in self.paths:
+                try:
+                    self.check(path)
+                except Exception:
+                    traceback.print_exc()
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _read(self, path: str) -> Optional[Snapshot]:
+        """snapshot a file, None if it changed while being read (it's probably still being saved)"""
+        stamp = self._stamp(path)
+        if stamp is None:
+            return None
+        try:
+            with open(path, newline='') as f:
+                snap = snapshot_rows(csv.DictReader(f))
+        except (KeyError, ValueError, csv.Error):
+            # half written, try again next time
+            return None
+        if self._stamp(path) != stamp:
+            return None
+        self.snapshots[path] = snap
+        self.stamps[path] = stamp
+        return snap
+
+    @profiled('Watcher.check')
+    def check(self, path: str):
+        """queue up a Change if the file is different to last time"""
+        if self._stamp(path) == self.stamps.get(path):
+            return
+        old = self.snapshots.get(path, Snapshot())
+        new = self._read(path)
+        if new is None:
+            return
+        change = diff(old, new)
+        if change:
+            self.changes.put(Change(path, change, new))
+
+
+def _parent_relation(parent: Person) -> Relation:
+    if parent.sex == Sex.male:
+        return Relation.father
+    if parent.sex == Sex.female:
+        return Relation.mother
+    return Relation.parent
+
+
+def _ends(key: EdgeKey, people: dict[Any, Person]) -> tuple[Optional[Person], Optional[Person]]:
+    return people.get(key[1]), people.get(key[2])
+
+
+def _add_edge(key: EdgeKey, notes: str, people: dict[Any, Person]):
+    a, b = _ends(key, people)
+    if a is None or b is None:
+        return
+    relation = key[0]
+    if relation in ('parent', 'adopted_parent'):
+        # parent relations are (relation, child, parent)
+        child, parent = a, b
+        if relation == 'parent':
+            up, down = _parent_relation(parent), Relation.child
+        else:
+            up, down = Relation.adopted_parent, Relation.adopted_child
+        if not any(fam.person_id == parent.id and fam.relation.is_parent() for fam in child.family):
+            child.family.append(Family(up, parent.id, parent, notes))
+        if not any(fam.person_id == child.id and fam.relation.is_child() for fam in parent.family):
+            parent.family.append(Family(down, child.id, child))
+    else:
+        for person, other in ((a, b), (b, a)):
+            if not any(fam.person_id == other.id and fam.relation.is_spouse() for fam in person.family):
+                person.family.append(Family(Relation[relation], other.id, other, notes))
+
+
+def _remove_edge(key: EdgeKey, people: dict[Any, Person]):
+    a, b = _ends(key, people)
+    if a is None or b is None:
+        return
+    if key[0] in ('parent', 'adopted_parent'):
+        a.family = [fam for fam in a.family if not (fam.person_id == b.id and fam.relation.is_parent())]
+        b.family = [fam for fam in b.family if not (fam.person_id == a.id and fam.relation.is_child())]
+    else:
+        a.family = [fam for fam in a.family if not (fam.person_id == b.id and fam.relation.is_spouse())]
+        b.family = [fam for fam in b.family if not (fam.person_id == a.id and fam.relation.is_spouse())]
+
+
+def _set_notes(key: EdgeKey, notes: str, people: dict[Any, Person]):
+    a, b = _ends(key, people)
+    if a is None or b is None:
+        return
+    for person, other in ((a, b), (b, a)):
+        for fam in person.family:
+            if fam.person_id == other.id and fam.relation not in siblings:
+                fam.notes = notes
+
+
+@profiled()
+def apply(tree: Tree, change: Change) -> set[Any]:
+    """make the tree match a change without connecting it all again, returns the ids of everyone touched"""
+    people = {person.id: person for person in tree}
+    values = change.snapshot.people
+    out = change.diff
+
+    for person_id in out.added:
+        if person_id in people:
+            continue
+        row = dict(zip(fields, values[person_id]), family='', id=person_id)
+        Person.seen_ids.discard(person_id)
+        person = person_from_row(row)
+        tree.tree.add(person)
+        people[person.id] = person
+
+    for person_id, changed in out.modified.items():
+        person = people.get(person_id)
+        if person is None:
+            continue
+        row = dict(zip(fields, values[person_id]))
+        for field in changed:
+            if field == 'sex':
+                person.sex = Sex[row['sex']] if row['sex'] else Sex.unknown
+                for fam in person.children:
+                    child = people.get(fam.person_id)
+                    for other in child.family if child is not None else ():
+                        if other.person_id == person.id and other.relation.is_parent() and other.relation != Relation.adopted_parent:
+                            other.relation = _parent_relation(person)
+            elif field in attributes:
+                setattr(person, attributes[field], row[field])
+
+    for key in out.relations_removed:
+        _remove_edge(key, people)
+    for key in out.relations_added:
+        _add_edge(key, change.snapshot.edges[key], people)
+    for key in out.relations_changed:
+        _set_notes(key, change.snapshot.edges[key], people)
+
+    for person_id in out.removed:
+        person = people.pop(person_id, None)
+        if person is None:
+            continue
+        for fam in person.family:
+            other = people.get(fam.person_id)
+            if other is not None:
+                other.family = [f for f in other.family if f.person_id != person_id]
+        tree.tree.discard(person)
+        Person.seen_ids.discard(person_id)
+        if tree._head is person:
+            tree._head = None
+
+    # anyone whose parents changed might have different siblings now
+    for key in (*out.relations_added, *out.relations_removed):
+        if key[0] in ('parent', 'adopted_parent') and key[1] in people:
+            relink_siblings(people[key[1]], people.get)
+
+    touched = set(out.added) | set(out.removed) | set(out.modified)
+    touched.update(person_id for key in (*out.relations_added, *out.relations_removed, *out.relations_changed) for person_id in key[1:])
+    return touched